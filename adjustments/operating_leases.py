@@ -1,73 +1,134 @@
+from dataclasses import dataclass
+
+import numpy as np
 import pandas as pd
 import numpy_financial as npf
 
+from dataloader import data_loader
 from cost_of_capital.wacc_inputs import WaccInputs
 from cost_of_capital import wacc
+from cost_of_capital.rating_table import rating_table_filepath
 
+######################################## Operating Lease Capitalization ########################################
+# Lease commitments are capitalized as debt once per input snapshot in a LeaseSchedule: the schedule
+# at the inputs' own pre-tax cost of debt is memoized (data_loader.derived_value), so every scalar
+# entry point below reuses it.
+# The lease table has the current year's lease expense, n explicit commitment years
+# (n_periods_of_future_operating_leases_in_financials) and a lump sum for the years beyond,
+# spread as an annuity over the years it embeds. The pre-tax cost of debt may be an array
+# (e.g. one rate per scenario), every rate is discounted in one pass.
 
-def select_operating_leases_current_year(data: WaccInputs) -> float:
-    df = data.operating_lease_expenses
-    return df.loc['Current Year', 'Lease Commitment']
+@dataclass
+class LeaseSchedule:
+    current_year_expense: float
+    commitments: np.array           # explicit commitment years 1..n
+    commitment_beyond: float        # lump sum of the years after year n
+    years_embedded_beyond: float    # lump sum / average explicit commitment
+    pre_tax_cost_of_debt: np.array
+    cumulative_discount_factors: np.array  # (..., n) for every rate
+    present_values: np.array               # (..., n + 1) explicit years and years beyond
+    present_value: np.array                # debt value of the leases
 
-def remove_current_year_from_operating_leases_df(data: WaccInputs) -> pd.DataFrame:
-    df = data.operating_lease_expenses
-    df = df.drop('Current Year')
-    return df
+    @property
+    def n_explicit_years(self) -> int:
+        return len(self.commitments)
+
+    @property
+    def yearly_commitment_beyond(self) -> float:
+        return self.commitment_beyond / self.years_embedded_beyond
+
+    @property
+    def asset_life(self) -> float:
+        """ Explicit commitment years + years embedded in the commitment beyond """
+        return self.n_explicit_years + self.years_embedded_beyond
+
+    @property
+    def depreciation(self) -> np.array:
+        return self.present_value / self.asset_life
+
+    @property
+    def operating_income_adjustment(self) -> np.array:
+        return self.current_year_expense - self.depreciation
+
+def lease_commitments(data: WaccInputs) -> tuple:
+    """ (current year expense, explicit commitments, commitment beyond), rows of the lease table by position """
+    commitments = np.asarray(data.operating_lease_expenses['Lease Commitment'], dtype="float64")
+    n_explicit_years = data.n_periods_of_future_operating_leases_in_financials
+    if len(commitments) != n_explicit_years + 2:
+        raise ValueError(f"Lease table has {len(commitments)} rows, expected current year, "
+                         f"{n_explicit_years} explicit years and the years beyond")
+    return commitments[0], commitments[1:-1], commitments[-1]
+
+def lease_schedule(data: WaccInputs, pt_cod=None) -> LeaseSchedule:
+    """
+    Args:
+        data: WaccInputs instance with the lease table
+        pt_cod: pre-tax cost of debt, scalar or array, computed from data if None
+    Returns:
+        LeaseSchedule, with present values of the shape of pt_cod; without pt_cod it is computed once
+        per input snapshot and shared, so it must not be mutated
+    """
+    if pt_cod is None:
+        # files of the riskfree rate, country and company default spreads in the pre-tax cost of debt
+        filepaths = [data.filepath_country_risk_premium, rating_table_filepath(data, data.rating_table_size)]
+        return data_loader.derived_value(filepaths, "lease_schedule",
+                                         lambda: lease_schedule(data, wacc.pre_tax_cost_of_debt(data)), data)
+    current_year_expense, commitments, commitment_beyond = lease_commitments(data)
+    rates = np.asarray(pt_cod, dtype="float64")
+    years_embedded_beyond = commitment_beyond / commitments.mean()
+
+    cumulative_discount_factors = (1 + rates[..., None]) ** -np.arange(1, len(commitments) + 1)
+    present_value_beyond = npf.pv(rates, years_embedded_beyond, -commitment_beyond / years_embedded_beyond) \
+        * cumulative_discount_factors[..., -1]
+    present_values = np.concatenate((commitments * cumulative_discount_factors, present_value_beyond[..., None]), axis=-1)
+    return LeaseSchedule(
+        current_year_expense=current_year_expense,
+        commitments=commitments,
+        commitment_beyond=commitment_beyond,
+        years_embedded_beyond=years_embedded_beyond,
+        pre_tax_cost_of_debt=rates,
+        cumulative_discount_factors=cumulative_discount_factors,
+        present_values=present_values,
+        present_value=present_values.sum(axis=-1),
+    )
+
+def select_operating_leases_current_year(data: WaccInputs) -> float:
+    return lease_commitments(data)[0]
 
 def estimate_years_embedded_in_commitment_year_6_and_beyond(data: WaccInputs) -> float:
-    df = remove_current_year_from_operating_leases_df(data)
-    return df.loc['6 and Beyond', 'Lease Commitment'] / df.loc[:5, 'Lease Commitment'].mean()
-
-def estimate_yearly_commitment_year_6_and_beyond(data: WaccInputs) -> float:
-    df = remove_current_year_from_operating_leases_df(data)
-    years_embedded_in_year_6_estimate = estimate_years_embedded_in_commitment_year_6_and_beyond(data)
-    return  df.loc['6 and Beyond', 'Lease Commitment'] / years_embedded_in_year_6_estimate
-
-def add_discounted_lease_commitments_to_operating_leases_df(data: WaccInputs) -> pd.DataFrame:
-    df = remove_current_year_from_operating_leases_df(data)
-    years_embedded_in_year_6_estimate = estimate_years_embedded_in_commitment_year_6_and_beyond(data)
-    yearly_commitment_year_6_and_beyond = estimate_yearly_commitment_year_6_and_beyond(data)
-    pt_cod = wacc.pre_tax_cost_of_debt(data)
-    df['Pre-Tax Cost of Debt'] = pt_cod
-    df['Cumulative Discount Factor'] = 1/(1 + df['Pre-Tax Cost of Debt']).cumprod()
-    df['Present Value'] = df['Lease Commitment'] * df['Cumulative Discount Factor']
-    df.loc['6 and Beyond', 'Present Value'] = npf.pv(
-        pt_cod, 
-        years_embedded_in_year_6_estimate,
-        -yearly_commitment_year_6_and_beyond
-    ) * df.loc[5, 'Cumulative Discount Factor']
-    return df
+    _, commitments, commitment_beyond = lease_commitments(data)
+    return commitment_beyond / commitments.mean()
 
-def create_operating_leases_df(data: WaccInputs) -> pd.DataFrame:
-    df = add_discounted_lease_commitments_to_operating_leases_df(data)
+def create_operating_leases_df(data: WaccInputs, pt_cod: float = None) -> pd.DataFrame:
+    """ Lease table with discount factors and present values, for display (pt_cod: scalar rate) """
+    schedule = lease_schedule(data, pt_cod)
+    df = data.operating_lease_expenses.drop(data.operating_lease_expenses.index[0])
+    df['Pre-Tax Cost of Debt'] = float(schedule.pre_tax_cost_of_debt)
+    df['Cumulative Discount Factor'] = np.append(schedule.cumulative_discount_factors,
+                                                 schedule.cumulative_discount_factors[-1] / (1 + schedule.pre_tax_cost_of_debt))
+    df['Present Value'] = schedule.present_values
     return df
 
-def debt_value_operating_leases(data: WaccInputs):
+def debt_value_operating_leases(data: WaccInputs, pt_cod: float = None):
+    """ pt_cod: pre-tax cost of debt if already known, computed from data otherwise """
     if not data.adjust_for_operating_leases:
         return 0
     else:
-        df = create_operating_leases_df(data)
-        return df["Present Value"].sum()
+        return float(lease_schedule(data, pt_cod).present_value)
 
 ############ Depreciation Leased Assets ############
 def operating_lease_asset_life(data: WaccInputs):
-    """ Asset life: first 5 years (hardcoded) + years embedded in year 6 estimate """
-    years_embedded_in_year_6_estimate = estimate_years_embedded_in_commitment_year_6_and_beyond(data)
-    asset_life = data.n_periods_of_future_operating_leases_in_financials + years_embedded_in_year_6_estimate
-    return asset_life
+    """ Asset life: explicit commitment years + years embedded in the commitment beyond """
+    years_embedded_beyond = estimate_years_embedded_in_commitment_year_6_and_beyond(data)
+    return data.n_periods_of_future_operating_leases_in_financials + years_embedded_beyond
 
 def yearly_depreciation_leased_asset(data: WaccInputs):
-    df = create_operating_leases_df(data)
-    asset_life = operating_lease_asset_life(data)
-    depreciation_leased_asset = df['Present Value'].sum() / asset_life
-    return depreciation_leased_asset
+    return float(lease_schedule(data).depreciation)
 
 ############ Adjustments to Operating Income & Total Debt ############
 def adjust_operating_income_for_operating_lease(data: WaccInputs):
-    operating_lease_expense_current_year = select_operating_leases_current_year(data)
-    depreciation = yearly_depreciation_leased_asset(data)
     if data.adjust_for_operating_leases:
-        return operating_lease_expense_current_year - depreciation
+        return float(lease_schedule(data).operating_income_adjustment)
     else:
         return 0
 
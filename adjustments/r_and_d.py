@@ -1,16 +1,70 @@
+from dataclasses import dataclass
+
+import numpy as np
 import pandas as pd
 
 from cost_of_capital.wacc_inputs import WaccInputs
 
-def amortization_table_research_and_development(data: WaccInputs):
+######################################## R&D Capitalization ########################################
+# R&D expenses are capitalized as a research asset amortized straight-line over its life.
+# The expense vintages are a NumPy array ordered by age (0 = current year), read from the input
+# table without changing it, and every amortizable life is valued in one broadcast pass.
+
+@dataclass
+class ResearchAsset:
+    """ Capitalized R&D for one or more amortizable lives (arrays of the shape of the lives) """
+    value: np.array                 # unamortized value of all vintages
+    amortization_current_year: np.array
+    expense_current_year: float
+    operating_income_adjustment: np.array
+
+def research_and_development_vintages(data: WaccInputs) -> np.array:
+    """ R&D expenses ordered by age, index 0 of the input table is the current year, -1 the year before, ... """
     df = data.research_and_development_expenses
-    df['Unamortized Portion'] = 1 + df.index.values / data.research_and_development_life
-    df['Value Unamortized Portion'] = df['R&D Expenses'] * df['Unamortized Portion']
-    df['Amortization This Year'] = df['R&D Expenses'].apply(lambda x: x / data.research_and_development_life)
-    df.loc[0, 'Amortization This Year'] = 0
-    df = df.reset_index(names="Year")
-    df.loc[0, "Year"] = "Current Year"
-    df = df.set_index("Year")
+    ages = -np.asarray(df.index, dtype="int64")
+    expenses = np.asarray(df['R&D Expenses'], dtype="float64")
+    vintages = np.zeros(ages.max() + 1)
+    valid = ~np.isnan(expenses)
+    vintages[ages[valid]] = expenses[valid]
+    return vintages
+
+def capitalize_research_and_development(vintages: np.array, lives) -> ResearchAsset:
+    """
+    Args:
+        vintages: (V,) R&D expenses ordered by age, vintages[0] is the current year
+        lives: amortizable life in years, scalar or array (e.g. one life per scenario)
+    Returns:
+        ResearchAsset with values of the shape of lives
+    """
+    lives = np.asarray(lives, dtype="float64")
+    ages = np.arange(len(vintages))
+    life = lives[..., None]
+    unamortized_portion = np.clip(1 - ages / life, 0, None)
+    amortizing = (ages >= 1) & (ages <= life)
+    value = (vintages * unamortized_portion).sum(axis=-1)
+    amortization = (vintages * amortizing / life).sum(axis=-1)
+    return ResearchAsset(
+        value=value,
+        amortization_current_year=amortization,
+        expense_current_year=vintages[0],
+        operating_income_adjustment=vintages[0] - amortization,
+    )
+
+def research_asset(data: WaccInputs) -> ResearchAsset:
+    return capitalize_research_and_development(research_and_development_vintages(data), data.research_and_development_life)
+
+def amortization_table_research_and_development(data: WaccInputs) -> pd.DataFrame:
+    """ Amortization table for display, a new frame: the input table is left unchanged """
+    vintages = research_and_development_vintages(data)
+    ages = np.arange(len(vintages))
+    life = data.research_and_development_life
+    unamortized_portion = np.clip(1 - ages / life, 0, None)
+    df = pd.DataFrame({
+        'R&D Expenses': vintages,
+        'Unamortized Portion': unamortized_portion,
+        'Value Unamortized Portion': vintages * unamortized_portion,
+        'Amortization This Year': np.where((ages >= 1) & (ages <= life), vintages / life, 0),
+    }, index=pd.Index(["Current Year"] + [str(-age) for age in ages[1:]], name="Year"))
     return df
 
 # Functions serving to adjust invested capital and operating income
@@ -18,24 +72,19 @@ def value_research_asset(data: WaccInputs):
     if not data.adjust_for_research_and_development:
         return 0
     else:
-        df = amortization_table_research_and_development(data)
-        return df['Value Unamortized Portion'].sum()
+        return float(research_asset(data).value)
 
 def amortization_current_year(data: WaccInputs):
-    df = amortization_table_research_and_development(data)
-    return df['Amortization This Year'].sum()
+    return float(research_asset(data).amortization_current_year)
 
 def select_research_and_development_expense_current_year(data: WaccInputs):
-    df = amortization_table_research_and_development(data)
-    return df.loc['Current Year', 'R&D Expenses']
+    return research_and_development_vintages(data)[0]
 
 def adjust_operating_income_for_research_and_development(data: WaccInputs):
     if not data.adjust_for_research_and_development:
         return 0
     else:
-        research_and_development_expense_current_year = select_research_and_development_expense_current_year(data)
-        amortization_asset_current_year = amortization_current_year(data)
-        return research_and_development_expense_current_year - amortization_asset_current_year
+        return float(research_asset(data).operating_income_adjustment)
 
 def tax_effect_research_and_development_expensing(data: WaccInputs):
     if not data.adjust_for_research_and_development:
@@ -0,0 +1,143 @@
+import numpy as np
+
+import dcf_module as dcf
+import forecast_engine as engine
+from cost_of_capital.wacc_graph import WaccGraph
+from model_data.model_inputs import ModelInputs
+
+######################################## Batch DCF ########################################
+# Values N scenarios of the valuation drivers at once with the forecast engine: every line item
+# of the free cashflow forecast is an (N, periods) array instead of a column of a DataFrame.
+# Scenario columns not given in the inputs are taken from the base ModelInputs instance.
+# The marginal tax rate also drives the stage 1 cost of capital (after-tax cost of debt, unlevered
+# and relevered betas): a scenario's tax rate adds its change of the stage 1 WACC versus the base
+# tax rate to cost_of_capital_stage_1, one WACC graph update per distinct tax rate.
+
+BATCH_COLUMNS = (
+    # valuation drivers
+    "growth_rate_stage_1",
+    "growth_rate_target_stage_2",
+    "perpetual_growth_rate",
+    "operating_margin_year_one",
+    "operating_margin_target",
+    "sales_to_capital_stage_1",
+    "sales_to_capital_target_stage_2",
+    "sales_to_capital_target_stage_3",
+    "cost_of_capital_stage_1",
+    "wacc_target_stage_2",
+    "wacc_target_stage_3",
+    "roc_in_perpetuity",
+    "effective_tax_rate",
+    "marginal_tax_rate",
+    "probability_of_failure",
+    "failure_proceeds_pct_of_value",
+    # base year and equity bridge
+    "revenues",
+    "operating_income",
+    "net_operating_loss",
+    "adjusted_invested_capital",
+    "equity_book_value",
+    "debt_book_value",
+    "minority_interests",
+    "cash_value",
+    "non_operating_assets",
+    "options_value",
+    "n_shares",
+)
+
+#################### Scenario Columns ####################
+
+def scenario_field_names(inputs) -> tuple:
+    """ Field names of a structured array, DataFrame or dict of arrays """
+    if hasattr(inputs, "dtype") and inputs.dtype.names is not None:
+        return inputs.dtype.names
+    if hasattr(inputs, "columns"):
+        return tuple(inputs.columns)
+    return tuple(inputs.keys())
+
+def n_scenarios(inputs) -> int:
+    if isinstance(inputs, dict):
+        return len(next(iter(inputs.values())))
+    return len(inputs)
+
+def base_scenario_columns(data: ModelInputs) -> dict:
+    """ Scalar value of every batch column for the base inputs, each evaluated once """
+    return dcf.valuation_drivers(data)
+
+def scenario_columns(data: ModelInputs, inputs, base: dict = None) -> dict:
+    """
+    Args:
+        data: base ModelInputs instance
+        inputs: structured array (or DataFrame / dict of arrays) with one row per scenario
+        base: precomputed base_scenario_columns(data), when valuing many chunks of scenarios
+    Returns:
+        Dict of (N,) float arrays for every batch column
+    """
+    names = scenario_field_names(inputs)
+    unknown = set(names) - set(BATCH_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unsupported batch columns: {sorted(unknown)}")
+
+    n = n_scenarios(inputs)
+    if base is None:
+        base = base_scenario_columns(data)
+    columns = {}
+    for name in BATCH_COLUMNS:
+        if name in names:
+            columns[name] = np.asarray(inputs[name], dtype="float64")
+        else:
+            columns[name] = np.full(n, base[name], dtype="float64")
+    if "marginal_tax_rate" in names:
+        columns["cost_of_capital_stage_1"] = columns["cost_of_capital_stage_1"] + tax_rate_wacc_change(
+            data, columns["marginal_tax_rate"], base["cost_of_capital_stage_1"])
+    return columns
+
+def tax_rate_wacc_change(data: ModelInputs, marginal_tax_rates: np.array, base_cost_of_capital: float) -> np.array:
+    """
+    Args:
+        data: base ModelInputs instance
+        marginal_tax_rates: (N,) marginal tax rate of every scenario
+        base_cost_of_capital: stage 1 cost of capital at data.marginal_tax_rate
+    Returns:
+        (N,) change of the stage 1 cost of capital versus the base tax rate, one WaccGraph update
+        per distinct tax rate (a continuous tax rate distribution costs one WACC evaluation per draw)
+    """
+    changes = np.zeros(len(marginal_tax_rates))
+    changed = marginal_tax_rates != data.marginal_tax_rate
+    if not changed.any():
+        return changes
+    tax_rates, inverse = np.unique(marginal_tax_rates[changed], return_inverse=True)
+    graph = WaccGraph(data)
+    costs = np.empty(len(tax_rates))
+    for i, tax_rate in enumerate(tax_rates):
+        graph.update(marginal_tax_rate=float(tax_rate))
+        costs[i] = graph.cost_of_capital()
+    changes[changed] = costs[inverse.ravel()] - base_cost_of_capital
+    return changes
+
+#################### Batch DCF Model ####################
+
+def batch_free_cashflow_forecast(data: ModelInputs, columns: dict) -> engine.Forecast:
+    """
+    Args:
+        data: base ModelInputs instance (stage lengths, methods and discounting convention)
+        columns: dict of (N,) arrays, see scenario_columns
+    Returns:
+        Forecast with an (N, horizon + 2) array per line item
+    """
+    return engine.free_cashflow_forecast(data, columns)
+
+def batch_valuation(data: ModelInputs, columns: dict) -> dict:
+    """ Forecast, terminal value, present values and equity bridge for every scenario, as (N,) arrays """
+    return engine.valuation(data, columns)
+
+def batch_value_per_share(data: ModelInputs, inputs) -> np.array:
+    """
+    Args:
+        data: base ModelInputs instance, supplies every column missing from inputs
+        inputs: structured array with one row per scenario and fields from BATCH_COLUMNS
+    Returns:
+        (N,) array of values per share
+    """
+    columns = scenario_columns(data, inputs)
+    return batch_valuation(data, columns)["value_per_share"]
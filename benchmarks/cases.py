@@ -0,0 +1,144 @@
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+
+import batch_dcf
+import dcf_module as dcf
+import live_valuation
+import portfolio
+import sensitivity
+import simulation
+from cost_of_capital import wacc
+from dataloader import data_loader
+from dataloader.data_loader_inputs import DataLoaderInputs
+from model_data.model_inputs import ModelInputs
+
+######################################## Benchmark Cases ########################################
+# Every case is a setup function returning the callable to time and the number of items it
+# processes per call (scenarios, companies, ...), used for the throughput. Fixtures are built from
+# the bundled data/ files and synthetic ModelInputs, outside of the timed call.
+
+CASES = {}
+
+def benchmark(name: str, repeat: int = 20):
+    """ Registers a setup function as benchmark case, timed repeat times """
+    def register(setup):
+        CASES[name] = (setup, repeat)
+        return setup
+    return register
+
+#################### Fixtures ####################
+
+def synthetic_lease_table() -> pd.DataFrame:
+    """ Lease commitments in the layout of the company financials workbook (the bundled sheet is empty) """
+    commitments = [52000, 50000, 47000, 44000, 41000, 38000, 150000]
+    index = pd.Index(["Current Year", 1, 2, 3, 4, 5, "6 and Beyond"], name="Year")
+    return pd.DataFrame({"Lease Commitment": np.array(commitments, dtype="float64")}, index=index)
+
+def model_inputs(**changes) -> ModelInputs:
+    data = ModelInputs(**changes)
+    if data.adjust_for_operating_leases:
+        data.operating_lease_expenses = synthetic_lease_table()
+    return data
+
+def universe(n_companies: int) -> dict:
+    """ Synthetic coverage universe, variations of the bundled company """
+    rng = np.random.default_rng(0)
+    return {f"CO{i:04d}": {"growth_rate_stage_1": rng.uniform(0, 0.2), "operating_margin_target": rng.uniform(0.02, 0.2),
+                           "price_per_share": rng.uniform(20, 60)}
+            for i in range(n_companies)}
+
+#################### Import & Reference Data ####################
+
+@benchmark("cold_import", repeat=5)
+def cold_import():
+    command = [sys.executable, "-c", "import dcf_module"]
+    return (lambda: subprocess.run(command, check=True)), 1
+
+@benchmark("reference_data_load_csv", repeat=10)
+def reference_data_load_csv():
+    data = DataLoaderInputs(filepath_reference_snapshot=None)
+    def load():
+        data_loader.invalidate_reference_cache()
+        data_loader.load_reference_tables(data)
+    return load, 4
+
+@benchmark("reference_data_load_cached")
+def reference_data_load_cached():
+    data = DataLoaderInputs()
+    data_loader.load_reference_tables(data)
+    return (lambda: data_loader.load_reference_tables(data)), 4
+
+#################### Scalar Valuation ####################
+
+@benchmark("cost_of_capital")
+def cost_of_capital():
+    data = model_inputs()
+    return (lambda: wacc.cost_of_capital(data)), 1
+
+@benchmark("df_free_cashflow_forecast")
+def df_free_cashflow_forecast():
+    data = model_inputs()
+    return (lambda: dcf.df_free_cashflow_forecast(data)), 1
+
+@benchmark("value_per_share")
+def value_per_share():
+    data = model_inputs()
+    return (lambda: dcf.value_per_share(data)), 1
+
+@benchmark("value_per_share_options")
+def value_per_share_options():
+    data = model_inputs(are_options_outstanding=True)
+    return (lambda: dcf.value_per_share(data)), 1
+
+@benchmark("value_per_share_leases")
+def value_per_share_leases():
+    data = model_inputs(adjust_for_operating_leases=True)
+    return (lambda: dcf.value_per_share(data)), 1
+
+@benchmark("value_per_share_no_r_and_d")
+def value_per_share_no_r_and_d():
+    data = model_inputs(adjust_for_research_and_development=False)
+    return (lambda: dcf.value_per_share(data)), 1
+
+@benchmark("value_per_share_all_adjustments")
+def value_per_share_all_adjustments():
+    data = model_inputs(are_options_outstanding=True, adjust_for_operating_leases=True)
+    return (lambda: dcf.value_per_share(data)), 1
+
+@benchmark("live_valuation_update_price", repeat=200)
+def live_valuation_update_price():
+    live = live_valuation.LiveValuation(model_inputs(are_options_outstanding=True))
+    prices = iter(np.tile(np.linspace(25, 40, 50), 1000))
+    return (lambda: live.update_price(next(prices))), 1
+
+#################### Batch & Portfolio ####################
+
+@benchmark("batch_value_per_share_100k", repeat=10)
+def batch_value_per_share_100k():
+    data = model_inputs()
+    rng = np.random.default_rng(0)
+    n = 100_000
+    inputs = {"growth_rate_stage_1": rng.uniform(0, 0.2, n), "operating_margin_target": rng.uniform(0.02, 0.2, n),
+              "cost_of_capital_stage_1": rng.uniform(0.06, 0.12, n)}
+    base = batch_dcf.base_scenario_columns(data)
+    return (lambda: batch_dcf.batch_valuation(data, batch_dcf.scenario_columns(data, inputs, base=base))), n
+
+@benchmark("sensitivity_grid_50x50", repeat=10)
+def sensitivity_grid_50x50():
+    data = model_inputs()
+    axes = {"growth_rate_stage_1": np.linspace(0, 0.2, 50), "cost_of_capital_stage_1": np.linspace(0.06, 0.12, 50)}
+    return (lambda: sensitivity.sensitivity_grid(data, axes)), 2500
+
+@benchmark("simulation_200k", repeat=5)
+def simulation_200k():
+    data = model_inputs()
+    distributions = {"growth_rate_stage_1": ("normal", 0.05, 0.02), "operating_margin_target": ("uniform", 0.02, 0.06)}
+    return (lambda: simulation.simulate(data, distributions, 200_000, seed=0)), 200_000
+
+@benchmark("portfolio_20_companies", repeat=5)
+def portfolio_20_companies():
+    manifest = universe(20)
+    return (lambda: portfolio.value_universe(manifest, max_workers=1)), 20
@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.cases import CASES
+
+######################################## Benchmark Runner ########################################
+# Times every case (p50/p99 latency, throughput in items per second) and measures its peak traced
+# memory in a separate call, so tracemalloc does not slow down the timed calls. Results are
+# compared against a stored baseline: a case regresses when its p50 latency or peak memory exceeds
+# the baseline by more than the tolerance, and the run exits with status 1.
+# Baselines are machine specific, save one on the machine that runs the comparison:
+#     python -m benchmarks.run --save-baseline
+#     python -m benchmarks.run
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+def run_case(name: str, repeat: int = None) -> dict:
+    setup, default_repeat = CASES[name]
+    call, n_items = setup()
+    call()  # warm up caches, as in a long running session
+
+    timings = []
+    for _ in range(repeat or default_repeat):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    call()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    p50 = float(np.percentile(timings, 50))
+    return {
+        "repeat": len(timings),
+        "p50_seconds": p50,
+        "p99_seconds": float(np.percentile(timings, 99)),
+        "throughput_per_second": n_items / p50,
+        "peak_memory_bytes": peak_memory,
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """ Regression messages of every case slower or larger than the baseline * (1 + tolerance) """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            continue
+        for metric in ("p50_seconds", "peak_memory_bytes"):
+            if result[metric] > reference[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {result[metric]:.6g} > baseline {reference[metric]:.6g}")
+    return regressions
+
+def machine() -> dict:
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+
+def print_results(results: dict):
+    print(f"{'case':<36}{'p50 (ms)':>12}{'p99 (ms)':>12}{'items/s':>14}{'peak (MB)':>12}")
+    for name, result in results.items():
+        print(f"{name:<36}{result['p50_seconds'] * 1e3:>12.3f}{result['p99_seconds'] * 1e3:>12.3f}"
+              f"{result['throughput_per_second']:>14.1f}{result['peak_memory_bytes'] / 2 ** 20:>12.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the valuation pipeline against a stored baseline")
+    parser.add_argument("cases", nargs="*", help=f"cases to run (default: all): {', '.join(CASES)}")
+    parser.add_argument("--repeat", type=int, help="timed calls per case (default: per case)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline json file")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    args = parser.parse_args()
+
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        parser.error(f"Unknown cases: {sorted(unknown)}")
+    results = {name: run_case(name, args.repeat) for name in args.cases or CASES}
+    print_results(results)
+
+    if args.save_baseline:
+        # cases not run keep their baseline
+        stored = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                stored = json.load(f)["results"]
+        with open(args.baseline, "w") as f:
+            json.dump({"machine": machine(), "results": {**stored, **results}}, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["machine"] != machine():
+            print(f"Warning: baseline recorded on {baseline['machine']}, timings may not be comparable")
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+    else:
+        print(f"No baseline at {args.baseline}, run with --save-baseline to store one")
@@ -0,0 +1,89 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from dataloader import data_loader
+from dataloader.data_loader_inputs import DataLoaderInputs
+
+######################################## Bottom-Up Beta ########################################
+# Industry unlevered betas (corrected for cash) and EV/Sales are compiled once into aligned arrays.
+# A company's bottom-up beta weights the industry betas by estimated value (revenues * EV/Sales),
+# so for a sparse company x industry revenue matrix R:
+#     unlevered beta = R @ (EV/Sales * beta) / R @ EV/Sales
+# one sparse matrix product for the whole universe, relevered per company with its D/E.
+
+@dataclass(frozen=True)
+class IndustryBetaMatrix:
+    industries: pd.Index
+    unlevered_beta_corrected_for_cash: np.array
+    ev_sales: np.array
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame) -> "IndustryBetaMatrix":
+        """ Industries missing a beta or EV/Sales get no weight in any company """
+        betas = np.asarray(df["Unlevered Beta Corrected For Cash"], dtype="float64")
+        ev_sales = np.asarray(df["EV/Sales"], dtype="float64")
+        missing = np.isnan(betas) | np.isnan(ev_sales)
+        return cls(
+            industries=pd.Index(df.index),
+            unlevered_beta_corrected_for_cash=np.where(missing, 0, betas),
+            ev_sales=np.where(missing, 0, ev_sales),
+        )
+
+    def industry_positions(self, industries) -> np.array:
+        positions = self.industries.get_indexer(industries)
+        if (positions < 0).any():
+            unknown = sorted(set(np.asarray(industries)[positions < 0]))
+            raise ValueError(f"Industries not in the beta table: {unknown}")
+        return positions
+
+    def revenue_mix_matrix(self, revenues) -> sparse.csr_matrix:
+        """
+        Args:
+            revenues: DataFrame with one row per company and one column per industry (NaN or 0: no revenues)
+                      or long DataFrame with 'Company', 'Industry' and 'Revenues' columns
+        Returns:
+            Sparse company x industry revenue matrix, columns aligned with the industries of the table
+        """
+        if {"Company", "Industry", "Revenues"} <= set(revenues.columns):
+            company_codes, _ = pd.factorize(revenues["Company"])
+            n_companies = company_codes.max() + 1
+            industries = self.industry_positions(revenues["Industry"])
+            values = np.asarray(revenues["Revenues"], dtype="float64")
+        else:
+            n_companies = len(revenues)
+            wide = np.nan_to_num(np.asarray(revenues, dtype="float64"))
+            company_codes, columns = np.nonzero(wide)
+            values = wide[company_codes, columns]
+            industries = self.industry_positions(revenues.columns)[columns]
+        return sparse.csr_matrix((values, (company_codes, industries)), shape=(n_companies, len(self.industries)))
+
+def bottom_up_beta(revenue_mix_matrix, beta_matrix: IndustryBetaMatrix, debt_to_equity=None,
+                   marginal_tax_rate=None) -> dict:
+    """
+    Args:
+        revenue_mix_matrix: sparse (or dense) company x industry revenues, see IndustryBetaMatrix.revenue_mix_matrix
+        beta_matrix: compiled industry betas
+        debt_to_equity: market D/E per company, to relever the betas
+        marginal_tax_rate: marginal tax rate, scalar or per company, required with debt_to_equity
+    Returns:
+        {"Unlevered Beta": (companies,) array, "Levered Beta": (companies,) array if debt_to_equity is given}
+    """
+    industry_values = np.column_stack((beta_matrix.ev_sales * beta_matrix.unlevered_beta_corrected_for_cash,
+                                       beta_matrix.ev_sales))
+    weighted = np.asarray(revenue_mix_matrix @ industry_values)
+    betas = {"Unlevered Beta": weighted[:, 0] / weighted[:, 1]}
+    if debt_to_equity is not None:
+        if marginal_tax_rate is None:
+            raise ValueError("marginal_tax_rate is required to relever the betas with debt_to_equity")
+        betas["Levered Beta"] = betas["Unlevered Beta"] * (1 + (1 - np.asarray(marginal_tax_rate)) * np.asarray(debt_to_equity))
+    return betas
+
+def industry_beta_matrix(data: DataLoaderInputs) -> IndustryBetaMatrix:
+    """ Industry betas of the instance's reference files, recompiled only when a file or the tax rate changes """
+    return data_loader.compiled_table(
+        [data.filepath_industry_beta_us, data.filepath_ev_to_sales_us], "industry_beta_matrix",
+        lambda: IndustryBetaMatrix.from_df(data_loader.load_and_wrangle_industry_beta_df(data)),
+        data.marginal_tax_rate)
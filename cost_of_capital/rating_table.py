@@ -0,0 +1,69 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from dataloader import data_loader
+from dataloader.data_loader_inputs import DataLoaderInputs
+from cost_of_capital.wacc_inputs import WaccInputs
+
+######################################## Synthetic Rating ########################################
+# The interest coverage table is compiled once per file version into sorted lower bounds and the
+# ratings and spreads of each bracket. A lookup is one np.searchsorted over the bounds, for a
+# single interest coverage ratio or an array of them (a portfolio or a batch of scenarios).
+
+RATING_TABLE_SIZES = ("large cap", "small cap")
+
+@dataclass(frozen=True)
+class RatingTable:
+    lower_bounds: np.array  # sorted, the bracket of a ratio is the last lower bound <= ratio
+    ratings: np.array
+    spreads: np.array
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame) -> "RatingTable":
+        df = df.sort_values("lower bound")
+        return cls(
+            lower_bounds=np.asarray(df["lower bound"], dtype="float64"),
+            ratings=np.asarray(df["Rating"]).astype(str),
+            spreads=np.asarray(df["Spread"], dtype="float64"),
+        )
+
+    def bracket(self, interest_coverage_ratio) -> np.array:
+        """ Index of the bracket, ratios below the lowest bound get the lowest bracket """
+        i = np.searchsorted(self.lower_bounds, interest_coverage_ratio, side="right") - 1
+        return np.maximum(i, 0)
+
+    def rating(self, interest_coverage_ratio):
+        return self.ratings[self.bracket(interest_coverage_ratio)]
+
+    def spread(self, interest_coverage_ratio):
+        return self.spreads[self.bracket(interest_coverage_ratio)]
+
+    def lookup(self, interest_coverage_ratio) -> tuple:
+        """ (ratings, spreads) of every interest coverage ratio """
+        i = self.bracket(interest_coverage_ratio)
+        return self.ratings[i], self.spreads[i]
+
+def rating_table_filepath(data: DataLoaderInputs, size: str) -> str:
+    if size == "large cap":
+        return data.filepath_interest_coverage_ratio
+    elif size == "small cap":
+        if not data.filepath_interest_coverage_ratio_small_cap:
+            raise ValueError("No small cap interest coverage table, set filepath_interest_coverage_ratio_small_cap")
+        return data.filepath_interest_coverage_ratio_small_cap
+    raise ValueError(f"Unknown rating table size: {size}, use one of {RATING_TABLE_SIZES}")
+
+def rating_table(data: WaccInputs, size: str = None) -> RatingTable:
+    """
+    Args:
+        data: WaccInputs instance
+        size: "large cap" or "small cap", default: data.rating_table_size
+    Returns:
+        Compiled RatingTable, recompiled only when the table file changes
+    """
+    size = size or data.rating_table_size
+    filepath = rating_table_filepath(data, size)
+    return data_loader.compiled_table(
+        [filepath], "rating_table",
+        lambda: RatingTable.from_df(data_loader.load_interest_coverage_ratio_to_df(data, filepath)))
@@ -5,10 +5,10 @@ import numpy_financial as npf
 
 from dataloader import data_loader
 from cost_of_capital.wacc_inputs import WaccInputs
+from cost_of_capital.rating_table import rating_table
+from cost_of_capital.industry_beta import industry_beta_matrix, bottom_up_beta
 from adjustments import operating_leases as opl
 
-data = WaccInputs()
-
 ########## Country Risk ##########
 
 
@@ -46,9 +46,8 @@ def company_erp_operating_countries_df(data: WaccInputs) -> pd.DataFrame:
     df = data_loader.load_company_revenues_by_country_to_df(data)
     df = df.dropna()
 
-    erp_df = data_loader.load_and_create_country_erp_df(data)
-    df["ERP"] = pd.merge(df, erp_df, how='inner', left_index=True, right_index=True)["ERP"]
-    df["Weight"] = df["Revenues"].apply(lambda x: x / df['Revenues'].sum()) 
+    df["ERP"] = data_loader.erp_table(data).countries_erp(df.index)
+    df["Weight"] = df["Revenues"] / df['Revenues'].sum()
     df["Weighted ERP"] = df["ERP"] * df["Weight"]
     return df
 
@@ -72,12 +71,12 @@ def company_erp_operating_regions_df(data: WaccInputs) -> pd.DataFrame:
     revenue_df = data_loader.load_company_revenues_by_region_to_df(data)
 
     df = pd.merge(revenue_df, region_erp_df, left_on="Region", right_on="Region", how="left")
-    df["Weight"] = df["Revenues"].apply(lambda x: x / df["Revenues"].sum())
+    df["Weight"] = df["Revenues"] / df["Revenues"].sum()
     return df
 
 def company_erp_operating_regions(data: WaccInputs) -> float:
     df = company_erp_operating_regions_df(data)
-    weighted_erp = df.apply(lambda row: (row["Weight"] * row["Region ERP"]), axis=1).agg(np.sum)
+    weighted_erp = (df["Weight"] * df["Region ERP"]).sum()
     return weighted_erp
 
 def company_erp(data: WaccInputs):
@@ -112,12 +111,14 @@ def company_beta_df(data: WaccInputs):
 
     df = pd.merge(df, beta_df, left_on="Industry", right_on="Industry", how="left")
     df["Estimated Value"] = df["Revenues"] * df["EV/Sales"]
-    df["Weight"] = df["Estimated Value"].apply(lambda x: x / df["Estimated Value"].sum())
+    df["Weight"] = df["Estimated Value"] / df["Estimated Value"].sum()
     return df
 
 def unlevered_beta_operating_assets(data: WaccInputs):
-    df = company_beta_df(data)
-    return (df["Weight"] * df["Unlevered Beta Corrected For Cash"]).sum()
+    revenues = data_loader.load_company_revenues_by_industry_to_df(data)["Revenues"].dropna()
+    beta_matrix = industry_beta_matrix(data)
+    revenue_mix = beta_matrix.revenue_mix_matrix(revenues.to_frame().T)
+    return float(bottom_up_beta(revenue_mix, beta_matrix)["Unlevered Beta"][0])
 
 def levered_beta_operating_assets(data: WaccInputs):
     unlevered_beta = unlevered_beta_operating_assets(data)
@@ -143,10 +144,13 @@ def country_default_spread(data: WaccInputs):
 
 def company_default_spread(data: WaccInputs):
     """might have a user-defined extra term if much revenue from low-risk countries (val slide 109)"""
-    df = data_loader.load_interest_coverage_ratio_to_df(data)
-    interest_coverage_ratio = data.operating_income / data.interest_expense 
-    df["Company Spread"] = df.apply(lambda x: (interest_coverage_ratio > x["lower bound"]) & (interest_coverage_ratio <= x["upper bound"]), axis=1)
-    return (df["Company Spread"] * df["Spread"]).sum()
+    return float(rating_table(data).spread(interest_coverage_ratio(data)))
+
+def interest_coverage_ratio(data: WaccInputs):
+    return data.operating_income / data.interest_expense
+
+def synthetic_rating(data: WaccInputs) -> str:
+    return str(rating_table(data).rating(interest_coverage_ratio(data)))
 
 def pre_tax_cost_of_debt(data: WaccInputs):
     rfr = riskfree_rate(data)
@@ -174,18 +178,20 @@ def equity_market_value(data: WaccInputs) -> float:
     return data.n_shares * data.price_per_share
 
 # Debt
+def present_value_of_debt(book_value: float, interest_expense: float, maturity: float, pt_cost_of_debt: float) -> float:
+    """ Debt valued as a bond: book value repaid at maturity plus the interest payments until then """
+    npv_book_value = book_value / (1 + pt_cost_of_debt)**maturity
+    pv_interest_payments = npf.pv(pt_cost_of_debt, maturity, -interest_expense)
+    return npv_book_value + pv_interest_payments
+
 def straight_debt_market_value(data: WaccInputs) -> float:
     pt_cost_of_debt = pre_tax_cost_of_debt(data)
-    npv_debt_book_value = data.debt_book_value / (1 + pt_cost_of_debt)**data.debt_maturity
-    pv_interest_payments = npf.pv(pt_cost_of_debt, data.debt_maturity, -data.interest_expense)
-    straight_debt_market_value = npv_debt_book_value + pv_interest_payments
-    return straight_debt_market_value
+    return present_value_of_debt(data.debt_book_value, data.interest_expense, data.debt_maturity, pt_cost_of_debt)
 
 def market_value_equity_and_debt_in_convertible_bond(data: WaccInputs) -> tuple[float, float]:
     pt_cod = pre_tax_cost_of_debt(data)
-    npv_convertible_bond = data.convertible_bond_book_value / (1 + pt_cod) ** data.convertible_bond_maturity
-    pv_interest_payments = npf.pv(pt_cod, data.convertible_bond_maturity, -data.convertible_bond_interest_expense)
-    debt_value_in_convertible_bond = npv_convertible_bond + pv_interest_payments
+    debt_value_in_convertible_bond = present_value_of_debt(data.convertible_bond_book_value, data.convertible_bond_interest_expense,
+                                                           data.convertible_bond_maturity, pt_cod)
     equity_value_in_convertible_bond_equity_value = data.convertible_bond_book_value - debt_value_in_convertible_bond
 
     return (equity_value_in_convertible_bond_equity_value, debt_value_in_convertible_bond)
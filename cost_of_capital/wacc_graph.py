@@ -0,0 +1,179 @@
+import copy
+from collections import Counter, defaultdict
+
+from cost_of_capital import wacc
+from cost_of_capital.wacc_inputs import WaccInputs
+from adjustments import operating_leases as opl
+
+######################################## WACC Graph ########################################
+# Each node of the cost of capital (riskfree rate, ERP, beta, spreads, market values, weights)
+# is evaluated once per input snapshot and memoized. While a node runs, the input fields it reads
+# and the nodes it uses are recorded; update() then only drops the nodes depending on the
+# changed fields, so a what-if on e.g. price_per_share reuses every price-independent node.
+
+NODES = {}
+
+def node(function):
+    NODES[function.__name__] = function
+    return function
+
+class TrackedInputs:
+    """ Read-only view of the graph's inputs that records every field a node reads """
+
+    def __init__(self, graph: "WaccGraph", name: str):
+        self._graph = graph
+        self._name = name
+
+    def __getattr__(self, field):
+        self._graph.field_dependents[field].add(self._name)
+        return getattr(self._graph.data, field)
+
+class WaccGraph:
+    """
+    Args:
+        data: WaccInputs instance, copied so updates never change the caller's inputs
+    """
+
+    def __init__(self, data: WaccInputs):
+        self.data = copy.copy(data)
+        self.values = {}
+        self.field_dependents = defaultdict(set)   # field -> nodes reading it
+        self.node_dependents = defaultdict(set)    # node -> nodes using it
+        self.evaluations = Counter()
+        self.stack = []
+
+    def value(self, name: str):
+        if self.stack:
+            self.node_dependents[name].add(self.stack[-1])
+        if name in self.values:
+            return self.values[name]
+        self.stack.append(name)
+        try:
+            result = NODES[name](self, TrackedInputs(self, name))
+        finally:
+            self.stack.pop()
+        self.values[name] = result
+        self.evaluations[name] += 1
+        return result
+
+    def __getitem__(self, name: str):
+        return self.value(name)
+
+    def update(self, **changes) -> set:
+        """
+        Args:
+            changes: input fields and their new values
+        Returns:
+            Nodes invalidated by the change, they are recomputed on next access
+        """
+        invalidated = set()
+        pending = []
+        for field, new_value in changes.items():
+            setattr(self.data, field, new_value)
+            pending.extend(self.field_dependents.get(field, ()))
+        while pending:
+            name = pending.pop()
+            if name in invalidated:
+                continue
+            invalidated.add(name)
+            self.values.pop(name, None)
+            pending.extend(self.node_dependents.get(name, ()))
+        return invalidated
+
+    def cost_of_capital(self) -> float:
+        return self.value("cost_of_capital")
+
+#################### Riskfree Rate & ERP ####################
+
+@node
+def riskfree_rate(graph: WaccGraph, data: WaccInputs):
+    return wacc.riskfree_rate(data)
+
+@node
+def company_erp(graph: WaccGraph, data: WaccInputs):
+    return wacc.company_erp(data)
+
+#################### Beta ####################
+
+@node
+def unlevered_beta_operating_assets(graph: WaccGraph, data: WaccInputs):
+    return wacc.unlevered_beta_operating_assets(data)
+
+@node
+def levered_beta_operating_assets(graph: WaccGraph, data: WaccInputs):
+    d_e = graph.value("total_debt_market_value") / graph.value("equity_market_value")
+    return graph.value("unlevered_beta_operating_assets") * (1 + (1 - data.marginal_tax_rate) * d_e)
+
+@node
+def cost_of_equity(graph: WaccGraph, data: WaccInputs):
+    return graph.value("riskfree_rate") + graph.value("levered_beta_operating_assets") * graph.value("company_erp")
+
+#################### Debt ####################
+
+@node
+def country_default_spread(graph: WaccGraph, data: WaccInputs):
+    return wacc.country_default_spread(data)
+
+@node
+def company_default_spread(graph: WaccGraph, data: WaccInputs):
+    return wacc.company_default_spread(data)
+
+@node
+def pre_tax_cost_of_debt(graph: WaccGraph, data: WaccInputs):
+    return graph.value("riskfree_rate") + graph.value("country_default_spread") + graph.value("company_default_spread")
+
+@node
+def after_tax_cost_of_debt(graph: WaccGraph, data: WaccInputs):
+    return graph.value("pre_tax_cost_of_debt") * (1 - data.marginal_tax_rate)
+
+#################### Preferred Stock ####################
+
+@node
+def cost_preferred_stock(graph: WaccGraph, data: WaccInputs):
+    return wacc.cost_preferred_stock(data)
+
+#################### Market Values ####################
+
+@node
+def equity_market_value(graph: WaccGraph, data: WaccInputs):
+    return wacc.equity_market_value(data)
+
+@node
+def straight_debt_market_value(graph: WaccGraph, data: WaccInputs):
+    return wacc.present_value_of_debt(data.debt_book_value, data.interest_expense, data.debt_maturity,
+                                      graph.value("pre_tax_cost_of_debt"))
+
+@node
+def debt_in_convertible_bond(graph: WaccGraph, data: WaccInputs):
+    return wacc.present_value_of_debt(data.convertible_bond_book_value, data.convertible_bond_interest_expense,
+                                      data.convertible_bond_maturity, graph.value("pre_tax_cost_of_debt"))
+
+@node
+def lease_schedule(graph: WaccGraph, data: WaccInputs):
+    if not data.adjust_for_operating_leases:
+        return None
+    return opl.lease_schedule(data, graph.value("pre_tax_cost_of_debt"))
+
+@node
+def debt_value_operating_leases(graph: WaccGraph, data: WaccInputs):
+    schedule = graph.value("lease_schedule")
+    return 0 if schedule is None else float(schedule.present_value)
+
+@node
+def total_debt_market_value(graph: WaccGraph, data: WaccInputs):
+    return (graph.value("straight_debt_market_value") + graph.value("debt_value_operating_leases")
+            + graph.value("debt_in_convertible_bond"))
+
+@node
+def preferred_stock_market_value(graph: WaccGraph, data: WaccInputs):
+    return wacc.preferred_stock_market_value(data)
+
+#################### Cost of Capital ####################
+
+@node
+def cost_of_capital(graph: WaccGraph, data: WaccInputs):
+    market_values = [graph.value("equity_market_value"), graph.value("total_debt_market_value"),
+                     graph.value("preferred_stock_market_value")]
+    costs = [graph.value("cost_of_equity"), graph.value("after_tax_cost_of_debt"), graph.value("cost_preferred_stock")]
+    total_market_value = sum(market_values)
+    return sum(market_value / total_market_value * cost for market_value, cost in zip(market_values, costs))
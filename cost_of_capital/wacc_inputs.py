@@ -4,8 +4,7 @@ import pandas as pd
 
 from dataloader import data_loader
 from dataloader.data_loader_inputs import DataLoaderInputs
-
-d_inputs = DataLoaderInputs()
+from dataloader.lazy_table import LazyTable
 
 @dataclass 
 class WaccInputs(DataLoaderInputs):
@@ -21,12 +20,13 @@ class WaccInputs(DataLoaderInputs):
     adjust_riskfree_rate_for_country_default_spread: bool = False
 
     # ERP & Country Default Spread for Equity and Debt
-    country_revenues: pd.DataFrame = data_loader.load_company_revenues_by_country_to_df(d_inputs)
-    region_revenues: pd.DataFrame = data_loader.load_company_revenues_by_region_to_df(d_inputs)
+    # company tables are loaded from the instance's filepaths on first access, not at import
+    country_revenues: pd.DataFrame = LazyTable(data_loader.load_company_revenues_by_country_to_df)
+    region_revenues: pd.DataFrame = LazyTable(data_loader.load_company_revenues_by_region_to_df)
     erp_geo_method: str = "region" # country or region
 
     # beta
-    industry_revenues: pd.DataFrame = data_loader.load_company_revenues_by_industry_to_df(d_inputs)
+    industry_revenues: pd.DataFrame = LazyTable(data_loader.load_company_revenues_by_industry_to_df)
 
     ### Weight of Equity
 
@@ -38,6 +38,7 @@ class WaccInputs(DataLoaderInputs):
     # Company Default Spread for Debt
     operating_income: float = 710000
     interest_expense: float = 101.7
+    rating_table_size: str = "large cap" # large cap or small cap interest coverage table
 
     ### Weight of Debt
 
@@ -65,9 +66,9 @@ class WaccInputs(DataLoaderInputs):
     # Operating Leases
     adjust_for_operating_leases: bool = False
     n_periods_of_future_operating_leases_in_financials: int = 5
-    operating_lease_expenses: pd.DataFrame = data_loader.load_company_operating_leases_to_df(d_inputs)
+    operating_lease_expenses: pd.DataFrame = LazyTable(data_loader.load_company_operating_leases_to_df)
 
     # Research & Development
     adjust_for_research_and_development: bool = True
     research_and_development_life: int = 4
-    research_and_development_expenses: pd.DataFrame = data_loader.load_company_research_and_development_to_df(d_inputs)
\ No newline at end of file
+    research_and_development_expenses: pd.DataFrame = LazyTable(data_loader.load_company_research_and_development_to_df)
\ No newline at end of file
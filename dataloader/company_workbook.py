@@ -0,0 +1,36 @@
+import importlib.util
+
+import pandas as pd
+
+######################################## Company Workbook ########################################
+# A company's input workbooks (revenues by country/region/industry, leases, R&D, historical
+# financials) have one table per sheet with the index in the first column. Every sheet is parsed in
+# one read of the workbook, instead of one pd.read_excel per sheet re-opening the zip/xml container,
+# with the calamine engine when python-calamine is installed.
+
+EXCEL_ENGINE = "calamine" if importlib.util.find_spec("python_calamine") else None
+
+def read_sheets(filepath: str) -> dict:
+    """ {sheet name: table} of every sheet of the workbook """
+    return pd.read_excel(filepath, sheet_name=None, index_col=0, engine=EXCEL_ENGINE)
+
+class CompanyWorkbook:
+    """
+    Args:
+        filepath: workbook with one table per sheet, indexed by its first column
+        tables: sheets already read with read_sheets, e.g. from a cache (default: read the workbook)
+    """
+
+    def __init__(self, filepath: str, tables: dict = None):
+        self.filepath = filepath
+        self.tables = read_sheets(filepath) if tables is None else tables
+
+    @property
+    def sheet_names(self) -> list:
+        return list(self.tables)
+
+    def table(self, sheet: str) -> pd.DataFrame:
+        """ Copy of the sheet's table, so callers can change it without changing the parsed workbook """
+        if sheet not in self.tables:
+            raise ValueError(f"No sheet '{sheet}' in {self.filepath}, sheets: {self.sheet_names}")
+        return self.tables[sheet].copy()
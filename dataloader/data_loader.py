@@ -1,8 +1,146 @@
+import os
+
 import numpy as np
 import pandas as pd
 
+from dataloader import snapshot
 from dataloader.data_loader_inputs import DataLoaderInputs
+from dataloader.erp_table import ErpBase, ErpTable
+from dataloader.implied_erp import ImpliedErpSeries, implied_erp
+from dataloader.financials_store import FinancialsStore
+from dataloader.company_workbook import CompanyWorkbook, read_sheets
+from dataloader.reference_cache import ReferenceDataCache, CacheStats, input_snapshot
+
+
+############################## Reference Data Cache ##############################
+
+# Reference tables are parsed once per file version and shared by every loader below.
+# A portfolio run exports the parsed tables to its worker processes with install_reference_tables.
+reference_cache = ReferenceDataCache(maxsize=32)
+# Company workbooks and tables compiled from reference files (rating tables, ERP bases, ...) are kept
+# apart, they are not exported to worker processes.
+compiled_cache = ReferenceDataCache(maxsize=64)
+# Values derived from a company's inputs (lease schedules) are keyed on the input snapshot and kept
+# apart too, so sweeps over the inputs never evict the compiled tables.
+derived_cache = ReferenceDataCache(maxsize=128)
+
+def read_reference_csv(filepath: str, **kwargs) -> pd.DataFrame:
+    return reference_cache.read(filepath, pd.read_csv, **kwargs)
+
+def read_reference_excel(filepath: str, **kwargs) -> pd.DataFrame:
+    return reference_cache.read(filepath, pd.read_excel, **kwargs)
+
+def compiled_table(filepaths, name: str, build, *parameters):
+    """
+    Args:
+        filepaths: files the table is compiled from
+        name: kind of table, e.g. "rating_table"
+        build: compiles the table, called without arguments when no current version is cached
+        parameters: model inputs the table depends on besides the files
+    Returns:
+        Compiled table, shared by all callers and recompiled only when a file or a parameter changes
+    """
+    return compiled_cache.compiled(filepaths, name, build, *parameters)
+
+def derived_value(filepaths, name: str, build, data):
+    """
+    Args:
+        filepaths: reference files the value is derived from besides the inputs
+        name: kind of value, e.g. "lease_schedule"
+        build: derives the value, called without arguments when no current version is cached
+        data: inputs dataclass instance the value is derived from, see reference_cache.input_snapshot
+    Returns:
+        Value derived once per input snapshot and file version, shared by all callers
+    """
+    return derived_cache.compiled(filepaths, name, build, input_snapshot(data))
+
+def invalidate_reference_cache(filepath: str = None):
+    """
+    Args:
+        filepath of the reference file to drop from the caches, None drops all files
+    """
+    reference_cache.invalidate(filepath)
+    compiled_cache.invalidate(filepath)
+    derived_cache.invalidate(filepath)
+
+def reference_cache_stats() -> CacheStats:
+    """
+    Returns:
+        Hits, misses, evictions, invalidations and size of the reference data cache
+    """
+    return reference_cache.stats()
+
+def compiled_cache_stats() -> CacheStats:
+    """
+    Returns:
+        Hits, misses, evictions, invalidations and size of the compiled table cache
+    """
+    return compiled_cache.stats()
+
+def load_reference_tables(data: DataLoaderInputs) -> dict:
+    """
+    Args:
+        DataLoaderInputs instance
+    Returns:
+        Cache entries of the ERP by country, industry beta, EV/Sales and interest coverage tables
+    """
+    load_base_ERP_data_to_df(data)
+    industry_beta_df_from_csv(data)
+    ev_sales_df_from_data(data)
+    load_interest_coverage_ratio_to_df(data)
+    return reference_cache.export()
+
+def install_reference_tables(tables: dict):
+    """
+    Args:
+        Cache entries from load_reference_tables, e.g. exported by a parent process
+    """
+    reference_cache.install(tables)
 
+############################## Reference Data Snapshot ##############################
+
+def load_snapshot_table(data: DataLoaderInputs, table: str, source_filepath: str, parameters: dict = None) -> pd.DataFrame:
+    """
+    Args:
+        data: DataLoaderInputs instance
+        table: snapshot table name
+        source_filepath: file the table is built from
+        parameters: inputs the table's derived columns depend on
+    Returns:
+        Snapshot table on read-only memory-mapped columns, None if there is no current snapshot of the
+        source file. The mapped table is cached as is, callers get a shallow copy: adding or dropping
+        columns never changes the cached table, writing to a mapped column copies it (copy-on-write)
+        or fails.
+    """
+    if not data.filepath_reference_snapshot:
+        return None
+    filepath = snapshot.manifest_filepath(data.filepath_reference_snapshot)
+    if not os.path.exists(filepath):
+        return None
+    manifest = reference_cache.read(filepath, snapshot.read_manifest)
+    if not snapshot.is_table_current(manifest, table, source_filepath, parameters):
+        return None
+    df = compiled_table([filepath], "snapshot_table", lambda: snapshot.read_table(filepath, table), table)
+    return df.copy(deep=False)
+
+def erp_snapshot_parameters(data: DataLoaderInputs) -> dict:
+    return {
+        "erp_mature_market": equity_risk_premium_mature_market(data),
+        "country_risk_equity_multiplier": country_risk_equity_multiplier(data),
+    }
+
+def implied_erp_snapshot_parameters(data: DataLoaderInputs) -> dict:
+    return {
+        "implied_erp_growth_rate": data.implied_erp_growth_rate,
+        "implied_erp_high_growth_years": data.implied_erp_high_growth_years,
+        "implied_erp_riskfree_rate": data.implied_erp_riskfree_rate,
+    }
+
+def beta_snapshot_parameters(data: DataLoaderInputs) -> dict:
+    return {"marginal_tax_rate": data.marginal_tax_rate}
+
+ERP_DERIVED_COLUMNS = ["Country Risk Premium", "ERP"]
+BETA_DERIVED_COLUMNS = ["Unlevered Beta", "Unlevered Beta Corrected For Cash"]
 
 ############################## General ##############################
 
@@ -13,7 +151,7 @@ def country_list(data: DataLoaderInputs):
     Returns:
         List of Countries for calculating equity risk premium
     """
-    df = pd.read_csv(data.filepath_country_risk_premium)
+    df = read_reference_csv(data.filepath_country_risk_premium)
     df = df.set_index('Country', drop=False)
     return list(df["Country"])
 
@@ -24,7 +162,7 @@ def region_list(data: DataLoaderInputs):
     Returns:
         List of Regions for calculating country risk premium
     """
-    df = pd.read_csv(data.filepath_country_risk_premium)
+    df = read_reference_csv(data.filepath_country_risk_premium)
     return list(df["Region"].unique())
 
 def industry_list(data: DataLoaderInputs) -> list[str]:
@@ -34,11 +172,20 @@ def industry_list(data: DataLoaderInputs) -> list[str]:
     Returns:
         List of Industries for calculating beta        
     """
-    df = pd.read_csv(data.filepath_industry_beta_us)
+    df = read_reference_csv(data.filepath_industry_beta_us)
     return list(df["Industry Name"].unique())
 
 ############################## Company Data from User Input ##############################
 
+def company_workbook(filepath: str) -> CompanyWorkbook:
+    """
+    Args:
+        filepath of a company input workbook
+    Returns:
+        Every sheet of the workbook, parsed once per file version
+    """
+    return CompanyWorkbook(filepath, compiled_cache.read(filepath, read_sheets))
+
 def load_company_revenues_by_country_to_df(data: DataLoaderInputs) -> pd.DataFrame:
     """
     Args:
@@ -46,7 +193,7 @@ def load_company_revenues_by_country_to_df(data: DataLoaderInputs) -> pd.DataFra
     Returns:
         Company revenues by country DataFrame
     """
-    df = pd.read_excel(data.filepath_company_revenue_inputs, 'country', index_col="Country")
+    df = company_workbook(data.filepath_company_revenue_inputs).table("country")
     return df.dropna()
 
 def load_company_revenues_by_region_to_df(data: DataLoaderInputs) -> pd.DataFrame:
@@ -56,7 +203,7 @@ def load_company_revenues_by_region_to_df(data: DataLoaderInputs) -> pd.DataFram
     Returns:
         Company revenues by Region DataFrame
     """
-    df = pd.read_excel(data.filepath_company_revenue_inputs, 'region', index_col="Region")
+    df = company_workbook(data.filepath_company_revenue_inputs).table("region")
     return df.dropna()
 
 def load_company_revenues_by_industry_to_df(data: DataLoaderInputs) -> pd.DataFrame:
@@ -66,7 +213,7 @@ def load_company_revenues_by_industry_to_df(data: DataLoaderInputs) -> pd.DataFr
     Returns:
         Company revenues by Industry DataFrame
     """
-    df = pd.read_excel(data.filepath_company_revenue_inputs, 'industry', index_col="Industry")
+    df = company_workbook(data.filepath_company_revenue_inputs).table("industry")
     return df.dropna()
 
 ########## Operating Leases ##########
@@ -78,11 +225,7 @@ def load_company_operating_leases_to_df(data: DataLoaderInputs) -> pd.DataFrame:
     Returns:
         Expected company operating leases
     """
-    data = pd.read_excel(
-        data.filepath_company_financials_inputs, 
-        sheet_name="leases",
-        index_col=0)
-    return data
+    return company_workbook(data.filepath_company_financials_inputs).table("leases")
 
 ########## Research and Development Expenses ##########
 
@@ -93,12 +236,8 @@ def load_company_research_and_development_to_df(data: DataLoaderInputs) -> pd.Da
     Returns:
         Historical company research and development expenses
     """
-    data = pd.read_excel(
-        data.filepath_company_financials_inputs, 
-        sheet_name="r&d",
-        index_col=0)
-    data = data.dropna()
-    return data
+    df = company_workbook(data.filepath_company_financials_inputs).table("r&d")
+    return df.dropna()
 
 ########## Historical Company Financials Data ##########
 
@@ -109,7 +248,30 @@ def load_historical_company_financials_to_df(data: DataLoaderInputs) -> pd.DataF
     Returns:
         Historical company financials from user inputs file
     """
-    pd.read_excel(data.filepath_company_financials_inputs)
+    return company_workbook(data.filepath_company_financials_inputs).table("historical")
+
+########## Company Financials Store ##########
+
+financials_stores = {}   # (statement workbook directory, saved store directory) -> FinancialsStore
+
+def company_financials_store(data: DataLoaderInputs) -> FinancialsStore:
+    """
+    Args:
+        DataLoaderInputs instance
+    Returns:
+        Store of the statement workbooks in data.filepath_company_financials_directory,
+        loaded from data.filepath_financials_store and updated with new or changed workbooks only
+    """
+    directory = os.path.abspath(data.filepath_company_financials_directory)
+    key = (directory, data.filepath_financials_store and os.path.abspath(data.filepath_financials_store))
+    store = financials_stores.get(key)
+    if store is None:
+        saved = data.filepath_financials_store and os.path.exists(snapshot.manifest_filepath(data.filepath_financials_store))
+        store = FinancialsStore.load(data.filepath_financials_store) if saved else FinancialsStore()
+        financials_stores[key] = store
+    if store.ingest(directory) and data.filepath_financials_store:
+        store.save(data.filepath_financials_store)
+    return store
 
 ############################## Riskfree Rate ##############################
 
@@ -124,10 +286,53 @@ def equity_risk_premium_mature_market(data: DataLoaderInputs):
     Args:
         DataLoaderInputs instance
     Returns:
-        Mature market ERP
-    Hard coded for now, normally comes from valuing S&P500 index
+        Mature market ERP: implied ERP of the S&P 500 at the valuation date,
+        data.erp_mature_market if no valuation date is set
+    """
+    if data.valuation_date is None:
+        return data.erp_mature_market
+    return implied_erp_series(data).at(data.valuation_date)
+
+##### Implied ERP of the S&P 500 #####
+
+def load_sp500_cash_yield_to_df(data: DataLoaderInputs) -> pd.DataFrame:
+    """
+    Args:
+        DataLoaderInputs instance
+    Returns:
+        Quarterly market value, dividends and buybacks ($ billions) of the S&P 500 and the trailing
+        12 month cash yield, indexed by quarter end
     """
-    return data.erp_mature_market
+    df = read_reference_excel(data.filepath_sp500_buyback, sheet_name="TABLE", header=None)
+    # quarter rows are dated, "9/30/2022 Prelim." for the last one; yearly rows ("2021", "12 Mo Sep,'22") are not
+    first_token = df[0].astype(str).str.split().str[0]
+    dates = pd.to_datetime(first_token, format="%Y-%m-%d", errors="coerce").fillna(
+        pd.to_datetime(first_token, format="%m/%d/%Y", errors="coerce"))
+    df = df.loc[dates.notna(), [1, 4, 5, 8]].astype("float64")
+    df.columns = ["Market Value", "Dividends", "Buybacks", "Cash Yield"]
+    df.index = pd.DatetimeIndex(dates[dates.notna()], name="Date")
+    return df.sort_index()
+
+def implied_erp_df(data: DataLoaderInputs) -> pd.DataFrame:
+    """
+    Args:
+        DataLoaderInputs instance
+    Returns:
+        Cash yield and implied ERP of every quarter end, from the snapshot if current
+    """
+    df = load_snapshot_table(data, "implied_erp", data.filepath_sp500_buyback, implied_erp_snapshot_parameters(data))
+    if df is not None:
+        return df
+    df = load_sp500_cash_yield_to_df(data)
+    df["Implied ERP"] = implied_erp(df["Cash Yield"], data.implied_erp_riskfree_rate, data.implied_erp_growth_rate,
+                                    data.implied_erp_high_growth_years)
+    return df
+
+def implied_erp_series(data: DataLoaderInputs) -> ImpliedErpSeries:
+    """ Implied ERP by date, solved again only when the source file or the model parameters change """
+    return compiled_table([data.filepath_sp500_buyback], "implied_erp_series",
+                          lambda: ImpliedErpSeries.from_df(implied_erp_df(data)),
+                          *implied_erp_snapshot_parameters(data).values())
 
 def country_risk_equity_multiplier(data: DataLoaderInputs):
     """
@@ -150,7 +355,10 @@ def load_base_ERP_data_to_df(data: DataLoaderInputs) -> pd.DataFrame:
     Returns:
         DataFrame of GDP, Rating-based Default Spread, Corporate Tax Rate, and Regions of all countries
     """
-    df = pd.read_csv(data.filepath_country_risk_premium)
+    df = load_snapshot_table(data, "country_risk_premium", data.filepath_country_risk_premium)
+    if df is not None:
+        return df.drop(columns=ERP_DERIVED_COLUMNS)
+    df = read_reference_csv(data.filepath_country_risk_premium)
     df = df.set_index('Country', drop=False)
     return df
 
@@ -161,6 +369,10 @@ def add_erp_to_country_risk_premium_df(data: DataLoaderInputs) -> pd.DataFrame:
     Returns:
         DataFrame of Equity Risk Premium for all countries
     """
+    df = load_snapshot_table(data, "country_risk_premium", data.filepath_country_risk_premium,
+                             erp_snapshot_parameters(data))
+    if df is not None:
+        return df
     df = load_base_ERP_data_to_df(data)
     erp_mature_market = equity_risk_premium_mature_market(data)
     multiplier = country_risk_equity_multiplier(data)
@@ -192,6 +404,19 @@ def load_and_create_country_erp_df(data: DataLoaderInputs) -> pd.DataFrame:
     df = add_weighted_erp_to_country_premium_df(data)
     return df
 
+##### ERP Table: Country, Region and Global ERP #####
+
+def erp_table(data: DataLoaderInputs) -> ErpTable:
+    """
+    Args:
+        DataLoaderInputs instance
+    Returns:
+        Country, GDP-weighted region and global ERP for the instance's mature market ERP and multiplier,
+        the country table is only read when the file changes
+    """
+    base = compiled_table([data.filepath_country_risk_premium], "erp_base", lambda: ErpBase(load_base_ERP_data_to_df(data)))
+    return base.table(equity_risk_premium_mature_market(data), country_risk_equity_multiplier(data))
+
 ##### Region Equity Risk premium #####
 
 def region_equity_risk_premium(data: DataLoaderInputs) -> pd.Series:
@@ -201,10 +426,7 @@ def region_equity_risk_premium(data: DataLoaderInputs) -> pd.Series:
     Returns:
         Weighted region ERP series
     """
-    df = load_and_create_country_erp_df(data)
-    columns = ["Region", "Weighted ERP"]
-    region_erp = df[columns].groupby("Region").apply(lambda x: x["Weighted ERP"].sum())
-    return region_erp
+    return erp_table(data).region_series().drop("Global")
 
 def add_global_erp_to_region_series(data: DataLoaderInputs) -> tuple[str, pd.Series]:
     """
@@ -213,10 +435,7 @@ def add_global_erp_to_region_series(data: DataLoaderInputs) -> tuple[str, pd.Ser
     Returns:
         Weighted region ERP series, including global ERP row
     """
-    df = load_and_create_country_erp_df(data)
-    df["GDP pct of world"] = df["GDP (in billions)"] / df["GDP (in billions)"].sum()
-    world_erp = (df["ERP"] * df["GDP pct of world"]).sum()
-    return ('Global', world_erp)
+    return ('Global', erp_table(data).global_erp)
 
 def create_region_erp_series(data: DataLoaderInputs) -> pd.Series:
     """
@@ -225,11 +444,7 @@ def create_region_erp_series(data: DataLoaderInputs) -> pd.Series:
     Returns:
         Region ERP series
     """
-    region_erp = region_equity_risk_premium(data)
-    region, erp = add_global_erp_to_region_series(data)
-    region_erp[region] = erp
-    region_erp.name = "Region ERP"
-    return region_erp
+    return erp_table(data).region_series()
 
 ########## Beta ##########
 
@@ -240,7 +455,10 @@ def industry_beta_df_from_csv(data: DataLoaderInputs) -> pd.DataFrame:
     Returns:
         Industry beta DataFrame from csv file
     """
-    df = pd.read_csv(data.filepath_industry_beta_us)
+    df = load_snapshot_table(data, "industry_beta", data.filepath_industry_beta_us)
+    if df is not None:
+        return df.drop(columns=BETA_DERIVED_COLUMNS)
+    df = read_reference_csv(data.filepath_industry_beta_us)
     columns = pd.Series(df.columns).apply(lambda x: x.strip())
     df.columns = columns
     df = df.rename({"Industry Name": "Industry"}, axis=1).set_index("Industry")
@@ -253,8 +471,11 @@ def add_unlevered_beta_corrected_for_cash_to_df(data: DataLoaderInputs) -> pd.Da
     Returns:
         Industry beta DataFrame with unlevered beta corrected for cash column
     """
+    df = load_snapshot_table(data, "industry_beta", data.filepath_industry_beta_us, beta_snapshot_parameters(data))
+    if df is not None:
+        return df
     df = industry_beta_df_from_csv(data)
-    df["Unlevered Beta"] = df.apply(lambda row: row["Levered Beta"] / (1 + (1 - data.marginal_tax_rate) * row["D/E Ratio"]), axis=1)
+    df["Unlevered Beta"] = df["Levered Beta"] / (1 + (1 - data.marginal_tax_rate) * df["D/E Ratio"])
     df["Unlevered Beta Corrected For Cash"] = df["Unlevered Beta"] / (1 - df["Cash/Firm value"])
     return df
 
@@ -266,7 +487,10 @@ def ev_sales_df_from_data(data: DataLoaderInputs) -> pd.Series:
         Industry beta DataFrame with 'EV to Sales' column
     """
     filepath = data.filepath_ev_to_sales_us
-    df = pd.read_excel(filepath, sheet_name="Industry Averages", skiprows=7, index_col=0)
+    df = load_snapshot_table(data, "ev_sales", filepath)
+    if df is not None:
+        return df["EV/Sales"]
+    df = read_reference_excel(filepath, sheet_name="Industry Averages", skiprows=7, index_col=0)
     df.index.name = "Industry"
     df["EV/Sales"] = df["Enteprise Value ($ millions)"] / df["Revenues ($ millions)"]
     return df["EV/Sales"]
@@ -301,14 +525,20 @@ def load_and_wrangle_industry_beta_df(data: DataLoaderInputs) -> pd.DataFrame:
 
 ########## Company Default Spread  ##########
 
-def load_interest_coverage_ratio_to_df(data: DataLoaderInputs) -> pd.DataFrame:
+def load_interest_coverage_ratio_to_df(data: DataLoaderInputs, filepath: str = None) -> pd.DataFrame:
     """
     Args:
         DataLoaderInputs instance
+        filepath: interest coverage table in the same format, e.g. the small cap table
+                  (default: filepath_interest_coverage_ratio)
     Returns:
         Interest Coverate Ratio DataFrame
     """
-    df = pd.read_csv(data.filepath_interest_coverage_ratio)
+    filepath = filepath or data.filepath_interest_coverage_ratio
+    df = load_snapshot_table(data, "interest_coverage", filepath)
+    if df is not None:
+        return df
+    df = read_reference_csv(filepath)
     df = df.rename({"Rating is": "Rating", "Spread is": "Spread"}, axis=1)
     df["Spread"] = pd.to_numeric(df["Spread"].str.strip("%")) / 100
     return df
@@ -7,10 +7,17 @@ class DataLoaderInputs:
     filepath_industry_beta_us: str = "data/beta_us.csv"
     filepath_ev_to_sales_us: str = "data/DollarUS.xls"
     filepath_interest_coverage_ratio: str = "data/interest_coverage.csv"
+    filepath_interest_coverage_ratio_small_cap: str = None # same format as the large cap table, not shipped
 
     filepath_company_revenue_inputs: str = "data/revenue_data/company_revenue_inputs.xlsx"
 
     filepath_company_financials_inputs: str = "data/company_financials/company_financials_user_inputs.xlsx"
+    filepath_company_financials_directory: str = "data/company_financials" # {ticker}_{statement}_{frequency}.xlsx workbooks
+    filepath_financials_store: str = "data/financials_store" # ingested statements, None: not saved
+
+    filepath_sp500_buyback: str = "data/index_data/sp-500-buyback.xlsx"
+
+    filepath_reference_snapshot: str = "data/snapshot" # built by: python -m dataloader.snapshot_builder
 
     # general financial variables
     marginal_tax_rate: float = 0.25
@@ -22,5 +29,9 @@ class DataLoaderInputs:
 
 
     # erp
-    erp_mature_market: float = 0.0594 # temporary, until s&p500 erp model exists
+    erp_mature_market: float = 0.0594 # used when no valuation_date is set
+    valuation_date: str = None # if set: implied S&P 500 ERP of the last quarter end on or before this date
+    implied_erp_growth_rate: float = 0.05 # expected growth of the S&P 500 cash yield in the high growth years
+    implied_erp_high_growth_years: int = 5
+    implied_erp_riskfree_rate: float = 0.0252 # US treasury bond rate, one rate for all dates of the series
     country_risk_equity_multiplier: float = 1.4106246 # temporary, until volatility from indices file exists
\ No newline at end of file
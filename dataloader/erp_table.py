@@ -0,0 +1,87 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+######################################## ERP Table ########################################
+# Country ERP = mature market ERP + multiplier * rating-based default spread, so every GDP-weighted
+# average of country ERPs (region ERP, global ERP) is the mature market ERP plus the multiplier
+# times the same average of the spreads. The GDP weights and weighted spreads only depend on the
+# country table and are computed once in ErpBase; an ErpTable for one (mature market ERP, multiplier)
+# is then a handful of vector operations, cheap enough to rebuild for every point of a sweep.
+
+GLOBAL_REGION = "Global"
+
+@dataclass(frozen=True)
+class ErpTable:
+    erp_mature_market: float
+    country_risk_equity_multiplier: float
+    countries: pd.Index
+    country_erp: np.array
+    regions: pd.Index           # region names, "Global" last
+    region_erp: np.array
+
+    def country(self, country: str) -> float:
+        return self.country_erp[self.countries.get_loc(country)]
+
+    def region(self, region: str) -> float:
+        return self.region_erp[self.regions.get_loc(region)]
+
+    @property
+    def global_erp(self) -> float:
+        return self.region_erp[-1]
+
+    def countries_erp(self, countries) -> np.array:
+        """ ERP of every country, NaN for countries not in the table """
+        positions = self.countries.get_indexer(countries)
+        return np.where(positions >= 0, self.country_erp[positions], np.nan)
+
+    def regions_erp(self, regions) -> np.array:
+        """ ERP of every region, NaN for regions not in the table """
+        positions = self.regions.get_indexer(regions)
+        return np.where(positions >= 0, self.region_erp[positions], np.nan)
+
+    def region_series(self) -> pd.Series:
+        return pd.Series(self.region_erp, index=self.regions.rename("Region"), name="Region ERP")
+
+class ErpBase:
+    """ GDP weights and weighted default spreads of a country table, independent of ERP and multiplier """
+
+    def __init__(self, df: pd.DataFrame, maxsize: int = 128):
+        """
+        Args:
+            df: country table with 'GDP (in billions)', 'Rating-based Default Spread' and 'Region', indexed by country
+            maxsize: number of ErpTables kept for reuse
+        """
+        region_codes, regions = pd.factorize(df["Region"], sort=True)
+        gdp = np.asarray(df["GDP (in billions)"], dtype="float64")
+        spreads = np.asarray(df["Rating-based Default Spread"], dtype="float64")
+        region_gdp = np.bincount(region_codes, weights=gdp)
+        region_spreads = np.bincount(region_codes, weights=spreads * gdp) / region_gdp
+        global_spread = (spreads * gdp).sum() / gdp.sum()
+
+        self.countries = pd.Index(df.index)
+        self.spreads = spreads
+        self.regions = pd.Index(list(regions) + [GLOBAL_REGION])
+        self.region_spreads = np.append(region_spreads, global_spread)
+        self.maxsize = maxsize
+        self.tables = OrderedDict()
+
+    def table(self, erp_mature_market: float, country_risk_equity_multiplier: float) -> ErpTable:
+        key = (erp_mature_market, country_risk_equity_multiplier)
+        table = self.tables.get(key)
+        if table is None:
+            table = ErpTable(
+                erp_mature_market=erp_mature_market,
+                country_risk_equity_multiplier=country_risk_equity_multiplier,
+                countries=self.countries,
+                country_erp=erp_mature_market + country_risk_equity_multiplier * self.spreads,
+                regions=self.regions,
+                region_erp=erp_mature_market + country_risk_equity_multiplier * self.region_spreads,
+            )
+            self.tables[key] = table
+            while len(self.tables) > self.maxsize:
+                self.tables.popitem(last=False)
+        self.tables.move_to_end(key)
+        return table
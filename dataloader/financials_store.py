@@ -0,0 +1,265 @@
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from dataloader import snapshot
+
+######################################## Company Financials Store ########################################
+# Statements of every company in one long table: a row per (ticker, statement, frequency, line item,
+# period end) and its value. Statement workbooks ({ticker}_{statement}_{frequency}.xlsx, dates in the
+# first row, line items in the first column) are parsed once and appended; a directory is ingested
+# incrementally, only workbooks that changed since the last ingestion are parsed again and replace
+# all rows of their (ticker, statement, frequency).
+# Rows are sorted on one int64 key, (series, ticker, day), series = (statement, frequency, line item),
+# so the rows of one series and ticker are contiguous and sorted by date: the value as of a date
+# for any number of tickers is one np.searchsorted.
+
+STATEMENTS = ("income", "bs", "cf")
+FREQUENCIES = ("annual", "quarterly", "trailing")
+COLUMNS = ["Ticker", "Statement", "Frequency", "Line Item", "Period End", "Value"]
+KEY_COLUMNS = COLUMNS[:-1]
+
+WORKBOOK_FILENAME = re.compile(r"^(?P<ticker>[^_]+)_(?P<statement>income|bs|cf)_(?P<frequency>annual|quarterly|trailing)\.xlsx$")
+DAY_SPAN = 2**17    # days since 1970 fit in 17 bits until 2328
+TABLE = "financials"
+
+#################### Workbooks ####################
+
+def read_statement_workbook(filepath: str, ticker: str, statement: str, frequency: str) -> pd.DataFrame:
+    """
+    Args:
+        filepath: statement workbook, period ends in the first row and line items in the first column
+        ticker, statement, frequency: keys of the workbook's rows
+    Returns:
+        Long table with COLUMNS, one row per reported value
+    """
+    df = pd.read_excel(filepath, header=None)
+    period_ends = pd.to_datetime(df.iloc[0, 1:]).to_numpy(dtype="datetime64[ns]")
+    df = df.iloc[1:].dropna(subset=[0])
+    values = df.iloc[:, 1:].apply(pd.to_numeric, errors="coerce").to_numpy(dtype="float64")
+    line_items, periods = np.nonzero(~np.isnan(values))
+    return pd.DataFrame({
+        "Ticker": ticker.upper(),
+        "Statement": statement,
+        "Frequency": frequency,
+        "Line Item": df.iloc[line_items, 0].astype(str).str.strip().to_numpy(),
+        "Period End": period_ends[periods],
+        "Value": values[line_items, periods],
+    }, columns=COLUMNS)
+
+def statement_workbooks(directory: str) -> list:
+    """ (filepath, ticker, statement, frequency) of every statement workbook in the directory """
+    workbooks = []
+    for filename in sorted(os.listdir(directory)):
+        match = WORKBOOK_FILENAME.match(filename)
+        if match:
+            workbooks.append((os.path.join(directory, filename), match["ticker"], match["statement"], match["frequency"]))
+    return workbooks
+
+#################### Store ####################
+
+def extend_index(index: pd.Index, values) -> tuple:
+    """ (index with the new values appended, codes of the values in it) """
+    uniques = pd.unique(np.asarray(values, dtype=object))
+    index = index.append(pd.Index(uniques[index.get_indexer(uniques) < 0], dtype=object))
+    return index, index.get_indexer(values)
+
+class FinancialsStore:
+    """
+    Args:
+        frame: long table with COLUMNS
+        sources: {absolute filepath: [mtime in ns, size]} of the ingested workbooks
+    Rows are kept as integer code arrays; tickers and line items are numbered in order of arrival,
+    so appending never renumbers stored rows and the sorted keys of the store stay sorted.
+    """
+
+    def __init__(self, frame: pd.DataFrame = None, sources: dict = None):
+        self.sources = dict(sources or {})
+        self.tickers = pd.Index([], dtype=object)
+        self.line_items = pd.Index([], dtype=object)
+        self.codes = {name: np.array([], dtype="int64") for name in ("ticker", "statement", "frequency", "line_item", "day")}
+        self.values = np.array([], dtype="float64")
+        self.keys = np.array([], dtype="int64")
+        if frame is not None:
+            self.append([frame])
+
+    def series_code(self, statement_codes, frequency_codes, item_codes):
+        return (np.asarray(statement_codes, dtype="int64") * len(FREQUENCIES) + frequency_codes) \
+            * max(len(self.line_items), 1) + item_codes
+
+    def key(self, series, ticker_codes, days):
+        return (series * max(len(self.tickers), 1) + ticker_codes) * DAY_SPAN + days
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def to_df(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            "Ticker": pd.Categorical.from_codes(self.codes["ticker"], categories=self.tickers),
+            "Statement": pd.Categorical.from_codes(self.codes["statement"], categories=STATEMENTS),
+            "Frequency": pd.Categorical.from_codes(self.codes["frequency"], categories=FREQUENCIES),
+            "Line Item": pd.Categorical.from_codes(self.codes["line_item"], categories=self.line_items),
+            "Period End": self.codes["day"].astype("datetime64[D]").astype("datetime64[ns]"),
+            "Value": self.values,
+        }, columns=COLUMNS)
+
+    #################### Appending ####################
+
+    def append(self, frames: list, sources: dict = None) -> "FinancialsStore":
+        """
+        Args:
+            frames: long tables with COLUMNS, e.g. a new quarter; rows replace stored rows with the same key
+            sources: {absolute filepath: signature} of the workbooks the frames were read from
+        Returns:
+            The store, updated in place
+        """
+        frame = pd.concat(list(frames), ignore_index=True)
+        statement_codes = pd.Index(STATEMENTS).get_indexer(frame["Statement"])
+        frequency_codes = pd.Index(FREQUENCIES).get_indexer(frame["Frequency"])
+        if (statement_codes < 0).any() or (frequency_codes < 0).any():
+            raise ValueError(f"Statements must be one of {STATEMENTS} and frequencies one of {FREQUENCIES}")
+        self.tickers, ticker_codes = extend_index(self.tickers, frame["Ticker"].astype(str))
+        self.line_items, item_codes = extend_index(self.line_items, frame["Line Item"].astype(str))
+        new_codes = {
+            "ticker": ticker_codes,
+            "statement": statement_codes,
+            "frequency": frequency_codes,
+            "line_item": item_codes,
+            "day": np.asarray(frame["Period End"], dtype="datetime64[D]").astype("int64"),
+        }
+        codes = {name: np.concatenate((self.codes[name], np.asarray(new_codes[name], dtype="int64"))) for name in self.codes}
+        values = np.concatenate((self.values, np.asarray(frame["Value"], dtype="float64")))
+
+        # the stored rows and the new rows are two sorted runs for the stable sort; on equal keys
+        # the later row is kept
+        keys = self.key(self.series_code(codes["statement"], codes["frequency"], codes["line_item"]),
+                        codes["ticker"], codes["day"])
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        last = np.append(keys[1:] != keys[:-1], True)
+        order = order[last]
+        self.keys = keys[last]
+        self.codes = {name: column[order] for name, column in codes.items()}
+        self.values = values[order]
+        self.sources.update(sources or {})
+        return self
+
+    def drop(self, workbooks: list) -> "FinancialsStore":
+        """
+        Args:
+            workbooks: (ticker, statement, frequency) of the statement workbooks whose rows are dropped
+        Returns:
+            The store, updated in place
+        """
+        if not len(self) or not workbooks:
+            return self
+        tickers, statements, frequencies = zip(*workbooks)
+        ticker_codes = self.tickers.get_indexer([ticker.upper() for ticker in tickers])
+        dropped = ((ticker_codes * len(STATEMENTS) + pd.Index(STATEMENTS).get_indexer(statements)) * len(FREQUENCIES)
+                   + pd.Index(FREQUENCIES).get_indexer(frequencies))[ticker_codes >= 0]
+        workbook_codes = (self.codes["ticker"] * len(STATEMENTS) + self.codes["statement"]) * len(FREQUENCIES) \
+            + self.codes["frequency"]
+        keep = ~np.isin(workbook_codes, dropped)
+        self.keys = self.keys[keep]
+        self.codes = {name: column[keep] for name, column in self.codes.items()}
+        self.values = self.values[keep]
+        return self
+
+    def ingest(self, directory: str) -> list:
+        """
+        Parses the statement workbooks of the directory that are new or changed since their last ingestion,
+        the rows of a changed workbook replace all its stored rows, so deleted periods and line items are dropped
+        Returns:
+            Filepaths of the ingested workbooks
+        """
+        frames, sources, changed = [], {}, []
+        for filepath, ticker, statement, frequency in statement_workbooks(directory):
+            source = os.path.abspath(filepath)
+            signature = snapshot.source_signature(filepath)
+            if self.sources.get(source) == signature:
+                continue
+            frames.append(read_statement_workbook(filepath, ticker, statement, frequency))
+            sources[source] = signature
+            if source in self.sources:
+                changed.append((ticker, statement, frequency))
+        if frames:
+            self.drop(changed).append(frames, sources)
+        return list(sources)
+
+    #################### Slices ####################
+
+    def series(self, ticker: str, statement: str, line_item: str, frequency: str = "quarterly") -> pd.Series:
+        """ Values of one line item of one company, indexed by period end """
+        ticker_code = self.tickers.get_indexer([ticker])[0]
+        item_code = self.line_items.get_indexer([line_item])[0]
+        series = self.series_code(STATEMENTS.index(statement), FREQUENCIES.index(frequency), item_code)
+        first_key = self.key(series, ticker_code, 0)
+        start, end = np.searchsorted(self.keys, [first_key, first_key + DAY_SPAN])
+        if ticker_code < 0 or item_code < 0:
+            start = end
+        period_ends = self.codes["day"][start:end].astype("datetime64[D]").astype("datetime64[ns]")
+        return pd.Series(self.values[start:end], index=pd.DatetimeIndex(period_ends, name="Period End"), name=line_item)
+
+    def as_of(self, statement: str, line_item: str, date, frequency: str = "trailing", tickers=None) -> pd.DataFrame:
+        """
+        Args:
+            statement: "income", "bs" or "cf"
+            line_item: e.g. "Revenue"
+            date: as of date, the last period ending on or before it is used
+            frequency: "trailing" (TTM), "quarterly" or "annual"
+            tickers: companies (default: all companies in the store)
+        Returns:
+            'Value' and 'Period End' per ticker, NaN / NaT for companies without a period before the date
+        """
+        tickers = self.tickers if tickers is None else pd.Index(tickers)
+        ticker_codes = self.tickers.get_indexer(tickers)
+        item_code = self.line_items.get_indexer([line_item])[0]
+        rows = np.full(len(tickers), -1)
+        if item_code >= 0:
+            series = self.series_code(STATEMENTS.index(statement), FREQUENCIES.index(frequency), item_code)
+            first_key = self.key(series, ticker_codes, 0)
+            day = np.datetime64(pd.Timestamp(date), "D").astype("int64")
+            found = np.searchsorted(self.keys, first_key + day, side="right") - 1
+            valid = (ticker_codes >= 0) & (found >= 0) & (self.keys[np.maximum(found, 0)] >= first_key)
+            rows = np.where(valid, found, -1)
+        found = rows >= 0
+        period_ends = np.full(len(tickers), np.datetime64("NaT"), dtype="datetime64[ns]")
+        period_ends[found] = self.codes["day"][rows[found]].astype("datetime64[D]")
+        return pd.DataFrame({"Value": np.where(found, self.values[rows], np.nan), "Period End": period_ends},
+                            index=pd.Index(tickers, name="Ticker"))
+
+    def ttm(self, statement: str, line_item: str, date, tickers=None) -> pd.Series:
+        """ Trailing twelve month value as of the date, per ticker """
+        return self.as_of(statement, line_item, date, "trailing", tickers)["Value"]
+
+    #################### Persistence ####################
+
+    def save(self, directory: str):
+        """ Code columns as .npy files, categories and ingested workbooks in the manifest, see dataloader.snapshot """
+        os.makedirs(directory, exist_ok=True)
+        columns = pd.DataFrame({**self.codes, "value": self.values}, index=pd.Index(self.keys, name="key"))
+        manifest = {
+            "format_version": snapshot.FORMAT_VERSION,
+            "tables": {TABLE: snapshot.write_table(directory, TABLE, columns)},
+            "tickers": list(self.tickers),
+            "line_items": list(self.line_items),
+            "sources": self.sources,
+        }
+        with open(snapshot.manifest_filepath(directory), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+    @classmethod
+    def load(cls, directory: str) -> "FinancialsStore":
+        filepath = snapshot.manifest_filepath(directory)
+        manifest = snapshot.read_manifest(filepath)
+        columns = snapshot.read_table(filepath, TABLE)
+        store = cls(sources=manifest["sources"])
+        store.tickers = pd.Index(manifest["tickers"], dtype=object)
+        store.line_items = pd.Index(manifest["line_items"], dtype=object)
+        store.codes = {name: np.array(columns[name]) for name in store.codes}
+        store.values = np.array(columns["value"])
+        store.keys = np.array(columns.index)
+        return store
@@ -0,0 +1,68 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+######################################## Implied ERP ########################################
+# Implied equity risk premium of the S&P 500: the expected return r at which the index level equals
+# the present value of its expected cash yield (dividends + buybacks). The trailing 12 month cash
+# yield grows at g for n high growth years, then at the riskfree rate forever:
+#     1 = sum_{t=1..n} y (1+g)^t / (1+r)^t + y (1+g)^n (1+rf) / ((r - rf) (1+r)^n)
+# per unit of index level, so the market value and the cash flows only enter through the yield.
+# The right hand side decreases in r, every date of the series is solved at once by bisection.
+
+@dataclass(frozen=True)
+class ImpliedErpSeries:
+    dates: np.array     # sorted datetime64[ns]
+    erp: np.array
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame) -> "ImpliedErpSeries":
+        df = df.sort_index()
+        return cls(dates=np.asarray(df.index, dtype="datetime64[ns]"), erp=np.asarray(df["Implied ERP"], dtype="float64"))
+
+    def at(self, valuation_date) -> float:
+        """ Implied ERP of the last date on or before the valuation date """
+        i = np.searchsorted(self.dates, np.datetime64(pd.Timestamp(valuation_date), "ns"), side="right") - 1
+        if i < 0:
+            raise ValueError(f"No implied ERP on or before {valuation_date}, the series starts on {self.dates[0]}")
+        return float(self.erp[i])
+
+def present_value_of_cash_yield(expected_return, cash_yield, riskfree_rate, growth_rate: float,
+                                high_growth_years: int) -> np.array:
+    """ Present value of the cash yield per unit of index level, for arrays of dates """
+    years = np.arange(1, high_growth_years + 1)
+    growth = (1 + growth_rate) ** years
+    discount = (1 + expected_return[..., None]) ** -years
+    high_growth = (cash_yield[..., None] * growth * discount).sum(axis=-1)
+    terminal = (cash_yield * growth[-1] * (1 + riskfree_rate) / (expected_return - riskfree_rate)) * discount[..., -1]
+    return high_growth + terminal
+
+def implied_erp(cash_yield, riskfree_rate, growth_rate: float, high_growth_years: int = 5,
+                max_erp: float = 1.0, tolerance: float = 1e-12) -> np.array:
+    """
+    Args:
+        cash_yield: trailing 12 month (dividends + buybacks) / index market value of every date
+        riskfree_rate: riskfree rate, scalar or per date
+        growth_rate: expected growth of the cash yield in the high growth years
+        high_growth_years: years of growth at growth_rate before the cash yield grows at the riskfree rate
+        max_erp: upper end of the bracket
+        tolerance: width of the bracket at which the bisection stops
+    Returns:
+        Implied ERP of every date, NaN where the bracket holds no root
+    """
+    cash_yield = np.asarray(cash_yield, dtype="float64")
+    riskfree_rate = np.broadcast_to(np.asarray(riskfree_rate, dtype="float64"), cash_yield.shape)
+    low = np.zeros(cash_yield.shape)
+    high = np.full(cash_yield.shape, max_erp)
+    # the present value is infinite at an ERP of 0, the root is bracketed if it is below 1 at max_erp
+    bracketed = present_value_of_cash_yield(riskfree_rate + high, cash_yield, riskfree_rate,
+                                            growth_rate, high_growth_years) < 1
+    n_iterations = int(np.ceil(np.log2(max_erp / tolerance)))
+    for _ in range(n_iterations):
+        middle = (low + high) / 2
+        above_price = present_value_of_cash_yield(riskfree_rate + middle, cash_yield, riskfree_rate,
+                                                  growth_rate, high_growth_years) > 1
+        low = np.where(above_price, middle, low)
+        high = np.where(above_price, high, middle)
+    return np.where(bracketed, (low + high) / 2, np.nan)
@@ -0,0 +1,24 @@
+class LazyTable:
+    """
+    Dataclass field default for a table loaded from the instance's own filepaths.
+    The loader runs on first access and its result is kept on the instance;
+    a table passed to the constructor or assigned later is used as is.
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return None # dataclass default: not loaded yet
+        table = instance.__dict__.get(self.name)
+        if table is None:
+            table = self.loader(instance)
+            instance.__dict__[self.name] = table
+        return table
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.name] = value
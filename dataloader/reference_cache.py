@@ -0,0 +1,164 @@
+import dataclasses
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import pandas as pd
+
+
+@dataclass
+class CacheStats:
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    size: int
+    maxsize: int
+
+class IdentityKey:
+    """ Hashable stand-in of an unhashable input value (table, array), equal only to the same object """
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __hash__(self) -> int:
+        return id(self.value)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, IdentityKey) and other.value is self.value
+
+def input_snapshot(data) -> tuple:
+    """
+    Args:
+        data: inputs dataclass instance, e.g. ModelInputs
+    Returns:
+        Key of the current field values; tables and arrays are keyed by identity, so they are replaced
+        (dataclasses.replace, WaccGraph.update) rather than edited in place
+    """
+    key = []
+    for field in dataclasses.fields(data):
+        value = getattr(data, field.name)
+        try:
+            hash(value)
+        except TypeError:
+            value = IdentityKey(value)
+        key.append(value)
+    return tuple(key)
+
+@dataclass
+class CacheEntry:
+    signature: tuple    # (mtime in ns, size in bytes) of the file(s) when it was parsed
+    frame: pd.DataFrame # or the object compiled from the files, see ReferenceDataCache.compiled
+
+class ReferenceDataCache:
+    """
+    Bounded LRU cache of parsed reference tables.
+    Entries are keyed on absolute path, reader and reader arguments, and are only
+    returned while the file's mtime and size still match the parsed version.
+    Callers receive copies, so mutating a returned frame never changes the cached table.
+    Objects compiled from one or more files (lookup tables, read-only frames) are cached the same
+    way with compiled, and are returned as is.
+    """
+
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(filepath: str, reader, kwargs: dict) -> tuple:
+        return (os.path.abspath(filepath), reader.__name__, tuple(sorted(kwargs.items())))
+
+    @staticmethod
+    def signature(filepath: str) -> tuple:
+        stat = os.stat(filepath)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def read(self, filepath: str, reader, **kwargs) -> pd.DataFrame:
+        """
+        Args:
+            filepath: file to parse
+            reader: pandas reader, e.g. pd.read_csv
+            kwargs: reader arguments
+        Returns:
+            Copy of the parsed table, from cache if the file is unchanged
+        """
+        key = self.key(filepath, reader, kwargs)
+        signature = self.signature(filepath)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.signature == signature:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return entry.frame.copy()
+            self.misses += 1
+
+        frame = reader(filepath, **kwargs)
+        self.store(key, CacheEntry(signature, frame))
+        return frame.copy()
+
+    def compiled(self, filepaths, name: str, build, *parameters):
+        """
+        Args:
+            filepaths: files the object is compiled from
+            name: kind of object, e.g. "rating_table"
+            build: compiles the object, called without arguments when no current version is cached
+            parameters: inputs the object depends on besides the files
+        Returns:
+            The cached object itself, not a copy: compiled objects must not be mutated
+        """
+        filepaths = tuple(os.path.abspath(filepath) for filepath in filepaths)
+        key = (filepaths, name, parameters)
+        signature = tuple(self.signature(filepath) for filepath in filepaths)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.signature == signature:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return entry.frame
+            self.misses += 1
+
+        compiled = build()
+        self.store(key, CacheEntry(signature, compiled))
+        return compiled
+
+    def store(self, key: tuple, entry: CacheEntry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def export(self) -> dict:
+        """ Current entries, to install in another process's cache """
+        with self.lock:
+            return dict(self.entries)
+
+    def install(self, entries: dict):
+        """ Adds exported entries, each is still checked against the file signature on read """
+        for key, entry in entries.items():
+            self.store(key, entry)
+
+    def invalidate(self, filepath: str = None):
+        """ Drops the entries of one file, or all entries """
+        with self.lock:
+            if filepath is None:
+                keys = list(self.entries)
+            else:
+                path = os.path.abspath(filepath)
+                keys = [key for key in self.entries if path in (key[0] if isinstance(key[0], tuple) else (key[0],))]
+            for key in keys:
+                del self.entries[key]
+            self.invalidations += len(keys)
+
+    def stats(self) -> CacheStats:
+        with self.lock:
+            return CacheStats(self.hits, self.misses, self.evictions, self.invalidations,
+                              len(self.entries), self.maxsize)
@@ -0,0 +1,105 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+######################################## Reference Data Snapshot ########################################
+# A snapshot is a directory with one .npy file per column of every cleaned reference table,
+# described by manifest.json. Columns are memory-mapped on read, so loading a table does not
+# parse any csv or xls file. The manifest records the signature of every source file and the
+# parameters the derived columns were computed with, so stale snapshots are never used.
+
+FORMAT_VERSION = 1
+MANIFEST_FILENAME = "manifest.json"
+
+def manifest_filepath(directory: str) -> str:
+    return os.path.join(directory, MANIFEST_FILENAME)
+
+def source_signature(filepath: str) -> list:
+    """ [mtime in ns, size in bytes] of a source file """
+    stat = os.stat(filepath)
+    return [stat.st_mtime_ns, stat.st_size]
+
+#################### Writing ####################
+
+def column_array(values) -> np.array:
+    """ Object columns are stored as fixed-width unicode so they can be memory-mapped """
+    array = np.asarray(values)
+    if array.dtype == object:
+        array = array.astype(str)
+    return array
+
+def write_table(directory: str, name: str, df: pd.DataFrame) -> dict:
+    """
+    Args:
+        directory: snapshot directory
+        name: table name
+        df: cleaned table
+    Returns:
+        Table entry of the manifest
+    """
+    table_directory = os.path.join(directory, name)
+    os.makedirs(table_directory, exist_ok=True)
+    np.save(os.path.join(table_directory, "index.npy"), column_array(df.index))
+    columns = []
+    for i, column in enumerate(df.columns):
+        filename = f"{i:03d}.npy"
+        np.save(os.path.join(table_directory, filename), column_array(df[column]))
+        columns.append({"name": column, "file": filename})
+    return {"index": df.index.name, "columns": columns}
+
+def write_snapshot(directory: str, tables: dict, parameters: dict):
+    """
+    Args:
+        directory: snapshot directory, created if missing
+        tables: {table name: (cleaned DataFrame, source filepath)}
+        parameters: inputs the derived columns depend on, e.g. marginal_tax_rate
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = {"format_version": FORMAT_VERSION, "parameters": parameters, "tables": {}}
+    for name, (df, source) in tables.items():
+        entry = write_table(directory, name, df)
+        entry["source"] = {"filepath": os.path.abspath(source), "signature": source_signature(source)}
+        manifest["tables"][name] = entry
+    with open(manifest_filepath(directory), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+#################### Reading ####################
+
+def read_manifest(filepath: str) -> dict:
+    with open(filepath) as f:
+        return json.load(f)
+
+def read_table(filepath: str, table: str) -> pd.DataFrame:
+    """
+    Args:
+        filepath: manifest of the snapshot
+        table: table name
+    Returns:
+        Table with memory-mapped columns
+    """
+    directory = os.path.dirname(filepath)
+    entry = read_manifest(filepath)["tables"][table]
+    table_directory = os.path.join(directory, table)
+    index = pd.Index(np.load(os.path.join(table_directory, "index.npy"), mmap_mode="r"), name=entry["index"])
+    columns = {column["name"]: np.load(os.path.join(table_directory, column["file"]), mmap_mode="r")
+               for column in entry["columns"]}
+    return pd.DataFrame(columns, index=index, copy=False)
+
+def is_table_current(manifest: dict, table: str, source_filepath: str, parameters: dict = None) -> bool:
+    """
+    Returns:
+        Whether the snapshot table was built from this unchanged source file
+        (and, if given, with these parameters)
+    """
+    if manifest.get("format_version") != FORMAT_VERSION or table not in manifest["tables"]:
+        return False
+    source = manifest["tables"][table]["source"]
+    if source["filepath"] != os.path.abspath(source_filepath):
+        return False
+    if not os.path.exists(source_filepath) or source["signature"] != source_signature(source_filepath):
+        return False
+    if parameters is not None:
+        return all(manifest["parameters"].get(name) == value for name, value in parameters.items())
+    return True
@@ -0,0 +1,40 @@
+import argparse
+import dataclasses
+
+from dataloader import data_loader
+from dataloader import snapshot
+from dataloader.data_loader_inputs import DataLoaderInputs
+
+
+def build_snapshot(data: DataLoaderInputs, directory: str = None) -> str:
+    """
+    Args:
+        data: DataLoaderInputs instance with the reference filepaths and derived column parameters
+        directory: snapshot directory (default: data.filepath_reference_snapshot)
+    Returns:
+        Snapshot directory
+    Parses the reference csv/xls files once and writes the cleaned tables, derived columns included
+    """
+    directory = directory or data.filepath_reference_snapshot
+    source_data = dataclasses.replace(data, filepath_reference_snapshot=None)
+    tables = {
+        "country_risk_premium": (data_loader.add_erp_to_country_risk_premium_df(source_data),
+                                 data.filepath_country_risk_premium),
+        "industry_beta": (data_loader.add_unlevered_beta_corrected_for_cash_to_df(source_data),
+                          data.filepath_industry_beta_us),
+        "ev_sales": (data_loader.ev_sales_df_from_data(source_data).to_frame(),
+                     data.filepath_ev_to_sales_us),
+        "interest_coverage": (data_loader.load_interest_coverage_ratio_to_df(source_data),
+                              data.filepath_interest_coverage_ratio),
+        "implied_erp": (data_loader.implied_erp_df(source_data), data.filepath_sp500_buyback),
+    }
+    parameters = {**data_loader.erp_snapshot_parameters(data), **data_loader.beta_snapshot_parameters(data),
+                  **data_loader.implied_erp_snapshot_parameters(data)}
+    snapshot.write_snapshot(directory, tables, parameters)
+    return directory
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the reference data files into a binary snapshot")
+    parser.add_argument("--output", default=DataLoaderInputs.filepath_reference_snapshot, help="snapshot directory")
+    args = parser.parse_args()
+    print(f"Reference data snapshot written to {build_snapshot(DataLoaderInputs(), args.output)}")
@@ -0,0 +1,127 @@
+import dataclasses
+
+import numpy as np
+import pandas as pd
+
+from dataloader.financials_store import COLUMNS, DAY_SPAN, FREQUENCIES, STATEMENTS, FinancialsStore
+
+######################################## Trailing Twelve Months ########################################
+# Quarterly statements rolled into trailing values for every quarter end of every company in one pass
+# over the store's sorted rows: income statement and cash flow items are summed over the last four
+# quarters, balance sheet items averaged. The rows of one (line item, company) are contiguous and
+# sorted by date, so a window is valid when the row three rows back belongs to the same line item and
+# company, is three quarters earlier and no quarter in between is missing.
+
+FLOW_STATEMENTS = ("income", "cf")      # summed
+STOCK_STATEMENTS = ("bs",)              # averaged
+QUARTERS = 4
+MIN_DAYS_THREE_QUARTERS, MAX_DAYS_THREE_QUARTERS = 250, 300
+
+# ModelInputs base year fields: (statement, line item, "ttm": trailing four quarters | "latest": last quarter)
+BASE_YEAR_ITEMS = {
+    "revenues": ("income", "Revenue", "ttm"),
+    "operating_income": ("income", "Operating Income", "ttm"),
+    "earnings_before_tax": ("income", "EBT", "ttm"),
+    "paid_in_taxes": ("income", "Income Tax Provision", "ttm"),
+    "interest_expense": ("income", "Non-operating Interest Expenses", "ttm"),
+    "equity_book_value": ("bs", "Shareholders Equity (Total)", "latest"),
+    "debt_book_value": ("bs", "Total Debt", "latest"),
+    "cash_and_equivalents": ("bs", "Cash and Short Term Investments", "latest"),
+    "n_shares": ("bs", "Shares (Common)", "latest"),
+}
+
+#################### Rolling ####################
+
+def rolling_quarters(values: np.array, days: np.array, groups: np.array) -> np.array:
+    """
+    Args:
+        values: quarterly values, sorted by group then date
+        days: period ends in days
+        groups: (line item, company) of every row
+    Returns:
+        Sum of every row and the three quarters before it, NaN when a quarter is missing
+    """
+    n = len(values)
+    totals = np.full(n, np.nan)
+    if n < QUARTERS:
+        return totals
+    cumulative = np.concatenate(([0.0], np.cumsum(np.nan_to_num(values))))
+    missing = np.concatenate(([0], np.cumsum(np.isnan(values))))
+    end = np.arange(QUARTERS - 1, n)
+    start = end - (QUARTERS - 1)
+    span = days[end] - days[start]
+    valid = ((groups[end] == groups[start]) & (missing[end + 1] == missing[start])
+             & (span >= MIN_DAYS_THREE_QUARTERS) & (span <= MAX_DAYS_THREE_QUARTERS))
+    totals[end] = np.where(valid, cumulative[end + 1] - cumulative[start], np.nan)
+    return totals
+
+def trailing_statements(store: FinancialsStore) -> pd.DataFrame:
+    """
+    Args:
+        store: FinancialsStore with quarterly statements
+    Returns:
+        Long table (financials_store.COLUMNS) with frequency "trailing": four quarter sums of the income
+        statement and cash flow items, four quarter averages of the balance sheet items, for every quarter end
+    """
+    quarterly = store.codes["frequency"] == FREQUENCIES.index("quarterly")
+    frames = []
+    for statements, average in ((FLOW_STATEMENTS, False), (STOCK_STATEMENTS, True)):
+        rows = np.flatnonzero(quarterly & np.isin(store.codes["statement"], [STATEMENTS.index(s) for s in statements]))
+        totals = rolling_quarters(store.values[rows], store.codes["day"][rows], store.keys[rows] // DAY_SPAN)
+        if average:
+            totals = totals / QUARTERS
+        rows, totals = rows[~np.isnan(totals)], totals[~np.isnan(totals)]
+        frames.append(pd.DataFrame({
+            "Ticker": store.tickers[store.codes["ticker"][rows]],
+            "Statement": np.asarray(STATEMENTS)[store.codes["statement"][rows]],
+            "Frequency": "trailing",
+            "Line Item": store.line_items[store.codes["line_item"][rows]],
+            "Period End": store.codes["day"][rows].astype("datetime64[D]").astype("datetime64[ns]"),
+            "Value": totals,
+        }, columns=COLUMNS))
+    return pd.concat(frames, ignore_index=True)
+
+def trailing_store(store: FinancialsStore) -> FinancialsStore:
+    """ Store of the trailing values built from the quarterly statements, see trailing_statements """
+    return FinancialsStore(trailing_statements(store))
+
+#################### Base Year ####################
+
+def base_year_table(store: FinancialsStore, tickers, as_of, trailing: FinancialsStore = None) -> pd.DataFrame:
+    """
+    Args:
+        store: FinancialsStore with quarterly statements
+        tickers: companies
+        as_of: date, the last quarter ending on or before it is the base year end
+        trailing: trailing_store(store) if already built, e.g. for many as of dates
+    Returns:
+        ModelInputs base year fields (BASE_YEAR_ITEMS) per ticker
+    """
+    trailing = trailing_store(store) if trailing is None else trailing
+    columns = {}
+    for field, (statement, line_item, method) in BASE_YEAR_ITEMS.items():
+        source = store if method == "latest" else trailing
+        frequency = "quarterly" if method == "latest" else "trailing"
+        columns[field] = source.as_of(statement, line_item, as_of, frequency, tickers)["Value"]
+    return pd.DataFrame(columns)
+
+def with_base_year(data, store: FinancialsStore, ticker: str, as_of, trailing: FinancialsStore = None,
+                   optional_fields=()):
+    """
+    Args:
+        data: ModelInputs instance
+        store, ticker, as_of, trailing: see base_year_table
+        optional_fields: BASE_YEAR_ITEMS fields that keep their value in data if the store has no value as of the date
+    Returns:
+        Copy of data with the base year of the ticker as of the date
+    """
+    ticker = ticker.upper()    # tickers are stored upper case, see financials_store.read_statement_workbook
+    if ticker not in store.tickers:
+        raise ValueError(f"No statements of {ticker} in the store")
+    base_year = base_year_table(store, [ticker], as_of, trailing).iloc[0]
+    missing = [field for field, value in base_year.items() if np.isnan(value) and field not in optional_fields]
+    if missing:
+        raise ValueError(f"No base year values of {ticker} as of {as_of} for {missing}, pass them as optional_fields "
+                         f"to keep the values of data")
+    base_year = base_year.dropna()
+    return dataclasses.replace(data, **{field: float(value) for field, value in base_year.items()})
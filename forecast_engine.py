@@ -0,0 +1,306 @@
+import numpy as np
+import pandas as pd
+
+import net_operating_loss as nol
+from model_data.model_inputs import ModelInputs
+
+######################################## Forecast Engine ########################################
+# Free cashflow forecast of N scenarios over a horizon set by the stage periods.
+# Every line item is an (N, horizon + 2) block of one preallocated array: column 0 is the base year,
+# columns 1..horizon the forecast years and the last column the terminal year.
+# The scalar valuation (dcf_module) is the N = 1 case; the table only becomes a DataFrame for display.
+
+FORECAST_LINE_ITEMS = (
+    "Revenue Growth Rate",
+    "Revenues",
+    "Operating Margin",
+    "Operating Income",
+    "Net Operating Loss",
+    "Operating Income corrected for NOL",
+    "Tax Rate",
+    "Taxes Paid",
+    "After-Tax Operating Income",
+    "Sales to Capital Ratio",
+    "Reinvestment",
+    "Adjusted Invested Capital",
+    "ROIC",
+    "FCFF",
+    "Cost of Capital",
+    "Cumulative Discount Factor",
+    "Cashflow Discount Factor",
+    "Discounted FCFF",
+)
+
+DISCOUNTING_CONVENTIONS = ("end of year", "mid-year", "quarterly")
+MIN_HORIZON = 5
+MAX_HORIZON = 50
+
+# ModelInputs fields the engine reads from data instead of the scenario columns: shared by all
+# scenarios of a batch, so only companies with equal settings can be valued in one batch
+ENGINE_SETTINGS = (
+    "stage_1_periods",
+    "stage_2_periods",
+    "stage_3_periods",
+    "model_periods",
+    "operating_margin_convergence_year",
+    "growth_method_stage_2",
+    "growth_method_stage_3",
+    "sales_to_capital_method_stage_2",
+    "sales_to_capital_method_stage_3",
+    "wacc_method_stage_2",
+    "wacc_method_stage_3",
+    "tax_rate_in_perpetuity",
+    "nol_usage_limit_pct_of_income",
+    "nol_annual_usage_cap",
+    "nol_expiry_years",
+    "discounting_convention",
+    "failure_proceeds_calculation_method",
+)
+
+def engine_settings(data: ModelInputs) -> tuple:
+    return tuple(getattr(data, name) for name in ENGINE_SETTINGS)
+
+#################### Horizon ####################
+
+def forecast_horizon(data: ModelInputs) -> int:
+    """ Number of forecast years: the sum of the stage periods """
+    horizon = data.stage_1_periods + data.stage_2_periods + data.stage_3_periods
+    if not MIN_HORIZON <= horizon <= MAX_HORIZON:
+        raise ValueError(f"Forecast horizon must be {MIN_HORIZON} to {MAX_HORIZON} years, stages sum to {horizon}")
+    if data.model_periods is not None and data.model_periods != horizon:
+        raise ValueError(f"model_periods ({data.model_periods}) does not match the stage periods ({horizon})")
+    if data.operating_margin_convergence_year > horizon:
+        raise ValueError(f"operating_margin_convergence_year ({data.operating_margin_convergence_year}) "
+                         f"is beyond the forecast horizon ({horizon})")
+    return horizon
+
+def period_labels(horizon: int) -> list:
+    return ["Base Year"] + [str(year) for year in range(1, horizon + 1)] + ["Terminal Year"]
+
+#################### Forecast Table ####################
+
+class Forecast:
+    """ Line items of the forecast of N scenarios in one contiguous (line items, N, horizon + 2) array """
+
+    def __init__(self, n_scenarios: int, horizon: int):
+        self.horizon = horizon
+        self.values = np.full((len(FORECAST_LINE_ITEMS), n_scenarios, horizon + 2), np.nan)
+        self.rows = {item: i for i, item in enumerate(FORECAST_LINE_ITEMS)}
+
+    def __getitem__(self, item: str) -> np.array:
+        """ (N, horizon + 2) view of a line item """
+        return self.values[self.rows[item]]
+
+    def years(self, item: str) -> np.array:
+        """ (N, horizon) view of the forecast years of a line item """
+        return self.values[self.rows[item], :, 1:-1]
+
+    def terminal(self, item: str) -> np.array:
+        return self.values[self.rows[item], :, -1]
+
+    def copy(self) -> "Forecast":
+        forecast = Forecast.__new__(Forecast)
+        forecast.horizon = self.horizon
+        forecast.values = self.values.copy()
+        forecast.rows = self.rows
+        return forecast
+
+    def to_df(self, scenario: int = 0) -> pd.DataFrame:
+        """ Forecast table of one scenario, one row per year """
+        df = pd.DataFrame(self.values[:, scenario, :].T, columns=list(FORECAST_LINE_ITEMS),
+                          index=pd.Index(period_labels(self.horizon), name="Year"))
+        return df
+
+#################### Convergence Functions ####################
+
+def forecast_rates_in_stage_batch(n_periods, prior_stage_rate, target_rate, method) -> np.array:
+    """
+    Returns:
+        (N, n_periods) rates of a stage: the target rate in every period ("constant"), or rates moving
+        linearly from the prior stage rate to the target rate in the last period ("converge")
+    """
+    if method == "constant":
+        return np.repeat(target_rate[:, None], n_periods, axis=1)
+    elif method == "converge":
+        return np.linspace(prior_stage_rate, target_rate, n_periods + 1, axis=1)[:, 1:]
+
+def stage_rates_batch(data: ModelInputs, stage_1_rate, target_stage_2, target_stage_3,
+                      method_stage_2, method_stage_3) -> np.array:
+    stage_1 = np.repeat(stage_1_rate[:, None], data.stage_1_periods, axis=1)
+    stage_2 = forecast_rates_in_stage_batch(data.stage_2_periods, stage_1_rate, target_stage_2, method_stage_2)
+    stage_3 = forecast_rates_in_stage_batch(data.stage_3_periods, target_stage_2, target_stage_3, method_stage_3)
+    return np.concatenate((stage_1, stage_2, stage_3), axis=1)
+
+def operating_margin_batch(data: ModelInputs, columns: dict, horizon: int) -> np.array:
+    converging_margins = np.linspace(columns["operating_margin_year_one"], columns["operating_margin_target"],
+                                     data.operating_margin_convergence_year, axis=1)
+    n_periods_constant_margin = horizon - data.operating_margin_convergence_year
+    constant_margins = np.repeat(columns["operating_margin_target"][:, None], n_periods_constant_margin, axis=1)
+    return np.concatenate((converging_margins, constant_margins), axis=1)
+
+def tax_rates_batch(data: ModelInputs, columns: dict) -> np.array:
+    effective = columns["effective_tax_rate"]
+    perpetual_tax_rate = effective if data.tax_rate_in_perpetuity == "effective" else columns["marginal_tax_rate"]
+    return stage_rates_batch(data, effective, effective, perpetual_tax_rate, "constant", "converge")
+
+#################### Discounting ####################
+
+def discount_factors(cost_of_capital: np.array, convention: str) -> tuple:
+    """
+    Args:
+        cost_of_capital: (N, horizon) yearly cost of capital
+        convention: "end of year" (cashflows at year end), "mid-year" (halfway through the year)
+                    or "quarterly" (a quarter of the cashflow at the end of every quarter)
+    Returns:
+        (cumulative end of year discount factors, discount factors of the yearly cashflows)
+    """
+    yearly_factor = 1 / (1 + cost_of_capital)
+    cumulative = np.cumprod(yearly_factor, axis=1)
+    if convention == "end of year":
+        return cumulative, cumulative
+    prior_year_end = cumulative / yearly_factor
+    if convention == "mid-year":
+        return cumulative, prior_year_end * yearly_factor**0.5
+    elif convention == "quarterly":
+        quarters = np.arange(1, 5) / 4
+        return cumulative, prior_year_end * (yearly_factor[..., None]**quarters).mean(axis=-1)
+    raise ValueError(f"Unknown discounting convention: {convention}, use one of {DISCOUNTING_CONVENTIONS}")
+
+#################### Forecast ####################
+
+def free_cashflow_forecast(data: ModelInputs, columns: dict) -> Forecast:
+    """
+    Args:
+        data: base ModelInputs instance (stage lengths, methods and discounting convention)
+        columns: dict of (N,) arrays of the valuation drivers, see batch_dcf.scenario_columns
+    Returns:
+        Forecast of the N scenarios
+    """
+    horizon = forecast_horizon(data)
+    forecast = Forecast(len(columns["revenues"]), horizon)
+    perp_growth_rate = columns["perpetual_growth_rate"]
+
+    growth = forecast["Revenue Growth Rate"]
+    growth[:, 1:-1] = stage_rates_batch(data, columns["growth_rate_stage_1"], columns["growth_rate_target_stage_2"],
+                                        perp_growth_rate, data.growth_method_stage_2, data.growth_method_stage_3)
+    growth[:, -1] = perp_growth_rate
+
+    revenues = forecast["Revenues"]
+    revenues[:, 0] = columns["revenues"]
+    revenues[:, 1:] = columns["revenues"][:, None] * np.cumprod(1 + growth[:, 1:], axis=1)
+
+    margins = forecast["Operating Margin"]
+    margins[:, 0] = columns["operating_income"] / columns["revenues"]
+    margins[:, 1:-1] = operating_margin_batch(data, columns, horizon)
+    margins[:, -1] = margins[:, -2]
+
+    operating_income = forecast["Operating Income"]
+    np.multiply(revenues, margins, out=operating_income)
+    operating_income[:, 0] = columns["operating_income"]
+
+    tax_rates = forecast["Tax Rate"]
+    tax_rates[:, 0] = columns["effective_tax_rate"]
+    tax_rates[:, 1:-1] = tax_rates_batch(data, columns)
+    tax_rates[:, -1] = columns["marginal_tax_rate"]
+
+    # NOL carried forward from the base year balance through the forecast and terminal year
+    net_operating_loss = forecast["Net Operating Loss"]
+    taxable_income = forecast["Operating Income corrected for NOL"]
+    taxes = forecast["Taxes Paid"]
+    net_operating_loss[:, 0] = columns["net_operating_loss"]
+    taxable_income[:, 0] = np.maximum(operating_income[:, 0], 0)
+    taxes[:, 0] = taxable_income[:, 0] * tax_rates[:, 0]
+    net_operating_loss[:, 1:], taxable_income[:, 1:], taxes[:, 1:] = nol.tax_schedule(
+        operating_income[:, 1:], tax_rates[:, 1:], columns["net_operating_loss"],
+        data.nol_usage_limit_pct_of_income, data.nol_annual_usage_cap, data.nol_expiry_years)
+    after_tax_operating_income = forecast["After-Tax Operating Income"]
+    np.subtract(operating_income, taxes, out=after_tax_operating_income)
+
+    sales_to_capital = forecast["Sales to Capital Ratio"]
+    sales_to_capital[:, 1:-1] = stage_rates_batch(data, columns["sales_to_capital_stage_1"],
+                                                  columns["sales_to_capital_target_stage_2"],
+                                                  columns["sales_to_capital_target_stage_3"],
+                                                  data.sales_to_capital_method_stage_2, data.sales_to_capital_method_stage_3)
+    reinvestment = forecast["Reinvestment"]
+    reinvestment[:, 1:-1] = np.diff(revenues[:, :-1], axis=1) / sales_to_capital[:, 1:-1]
+
+    invested_capital = forecast["Adjusted Invested Capital"]
+    invested_capital[:, 0] = columns["adjusted_invested_capital"]
+    invested_capital[:, 1:-1] = columns["adjusted_invested_capital"][:, None] + np.cumsum(reinvestment[:, 1:-1], axis=1)
+    roic = forecast["ROIC"]
+    np.divide(after_tax_operating_income, invested_capital, out=roic)
+
+    discount_forecast(data, forecast, columns)
+    return forecast
+
+def discount_forecast(data: ModelInputs, forecast: Forecast, columns: dict) -> Forecast:
+    """
+    Fills the cost of capital dependent line items (cost of capital, terminal year reinvestment and FCFF,
+    discount factors, discounted FCFF) of a forecast whose operating line items are already set, in place.
+    Only this part changes with cost_of_capital_stage_1, e.g. when the share price moves.
+    """
+    perp_growth_rate = columns["perpetual_growth_rate"]
+    after_tax_operating_income = forecast["After-Tax Operating Income"]
+    reinvestment = forecast["Reinvestment"]
+    roic = forecast["ROIC"]
+
+    cost_of_capital = forecast["Cost of Capital"]
+    cost_of_capital[:, 1:-1] = stage_rates_batch(data, columns["cost_of_capital_stage_1"], columns["wacc_target_stage_2"],
+                                                 columns["wacc_target_stage_3"], data.wacc_method_stage_2, data.wacc_method_stage_3)
+    cost_of_capital[:, -1] = cost_of_capital[:, -2]
+
+    # terminal year return on capital: custom, or NaN meaning the terminal cost of capital
+    roic[:, -1] = np.where(np.isnan(columns["roc_in_perpetuity"]), cost_of_capital[:, -1], columns["roc_in_perpetuity"])
+    reinvestment[:, -1] = perp_growth_rate / roic[:, -1] * after_tax_operating_income[:, -1]
+
+    fcff = forecast["FCFF"]
+    np.subtract(after_tax_operating_income, reinvestment, out=fcff)
+
+    cumulative, cashflow = discount_factors(cost_of_capital[:, 1:-1], data.discounting_convention)
+    cumulative_discount_factor = forecast["Cumulative Discount Factor"]
+    cumulative_discount_factor[:, 1:-1] = cumulative
+    cumulative_discount_factor[:, -1] = cumulative[:, -1]
+    cashflow_discount_factor = forecast["Cashflow Discount Factor"]
+    cashflow_discount_factor[:, 1:-1] = cashflow
+    # applied to the terminal value at the end of the horizon: end of horizon discount factor
+    # times the within-year timing of the cashflows
+    cashflow_discount_factor[:, -1] = cashflow[:, -1]
+    forecast["Discounted FCFF"][:, 1:-1] = fcff[:, 1:-1] * cashflow
+    return forecast
+
+#################### Valuation ####################
+
+def valuation(data: ModelInputs, columns: dict) -> dict:
+    """ Forecast, terminal value, present values and equity bridge for every scenario, as (N,) arrays """
+    return equity_bridge(data, columns, free_cashflow_forecast(data, columns))
+
+def equity_bridge(data: ModelInputs, columns: dict, forecast: Forecast) -> dict:
+    """ Terminal value, present values and equity bridge of a discounted forecast """
+    perp_growth_rate = columns["perpetual_growth_rate"]
+
+    # terminal value at the end of the horizon, its cashflows timed within the year as the forecast years' cashflows
+    terminal_val = forecast.terminal("FCFF") / (forecast.terminal("Cost of Capital") - perp_growth_rate)
+    discounted_terminal_val = terminal_val * forecast.terminal("Cashflow Discount Factor")
+    discounted_cashflows = forecast.years("Discounted FCFF").sum(axis=1) + discounted_terminal_val
+
+    if data.failure_proceeds_calculation_method == "book value":
+        bankruptcy_proceeds = columns["failure_proceeds_pct_of_value"] * (columns["equity_book_value"] + columns["debt_book_value"])
+    elif data.failure_proceeds_calculation_method == "fair value":
+        bankruptcy_proceeds = columns["failure_proceeds_pct_of_value"] * discounted_cashflows
+    probability_of_failure = columns["probability_of_failure"]
+    val_op_assets = discounted_cashflows * (1 - probability_of_failure) + bankruptcy_proceeds * probability_of_failure
+
+    equity_val = (val_op_assets - columns["debt_book_value"] - columns["minority_interests"]
+                  + columns["cash_value"] + columns["non_operating_assets"])
+    value_common_stock = equity_val - columns["options_value"]
+
+    return {
+        "forecast": forecast,
+        "terminal_value": terminal_val,
+        "discounted_terminal_value": discounted_terminal_val,
+        "sum_of_discounted_cashflows": discounted_cashflows,
+        "value_operating_assets": val_op_assets,
+        "value_equity": equity_val,
+        "value_equity_in_common_stock": value_common_stock,
+        "value_per_share": value_common_stock / columns["n_shares"],
+    }
@@ -0,0 +1,206 @@
+import functools
+import importlib
+import inspect
+import json
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+######################################## Instrumentation ########################################
+# Opt-in timing of the valuation pipeline. While the instrument() context is active, every function
+# defined in the instrumented modules is replaced by a wrapper that counts calls and measures
+# cumulative time (outermost call of the function) and self time (minus the time of instrumented
+# callees). Modules call each other through their module attributes (wacc.pre_tax_cost_of_debt, ...),
+# so cross-module calls are measured too. The pandas readers are wrapped to record every file that
+# is actually parsed, reads served by the reference data cache do not show up.
+# All wrappers are removed on exit. Single-threaded: worker processes of a pool are not measured.
+
+DEFAULT_MODULES = (
+    "dcf_module",
+    "forecast_engine",
+    "cost_of_capital.wacc",
+    "dataloader.data_loader",
+    "adjustments.operating_leases",
+    "adjustments.r_and_d",
+    "options",
+)
+
+FILE_READERS = ("read_csv", "read_excel")  # pandas readers
+
+#################### Report ####################
+
+@dataclass
+class FunctionStats:
+    calls: int = 0
+    cumulative_seconds: float = 0.0
+    self_seconds: float = 0.0
+    active: int = 0  # calls of the function on the stack, only the outermost adds cumulative time
+
+@dataclass
+class FileRead:
+    reader: str
+    path: str
+    bytes: int      # size of the file, None for buffers
+    seconds: float
+
+@dataclass
+class Span:
+    """ OpenTelemetry-style span of one instrumented call """
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: str
+    start_time_unix_nano: int
+    end_time_unix_nano: int
+    attributes: dict = field(default_factory=dict)
+
+@dataclass
+class InstrumentationReport:
+    functions: dict = field(default_factory=dict)     # "module.function" -> FunctionStats
+    file_reads: list = field(default_factory=list)    # FileRead in call order
+    spans: list = field(default_factory=list)         # Span, only recorded with an exporter
+    wall_seconds: float = 0.0
+
+    def functions_df(self) -> pd.DataFrame:
+        """ Calls, cumulative and self time per function, slowest self time first """
+        df = pd.DataFrame(
+            [(name, stats.calls, stats.cumulative_seconds, stats.self_seconds) for name, stats in self.functions.items()],
+            columns=["Function", "Calls", "Cumulative Seconds", "Self Seconds"],
+        ).set_index("Function")
+        return df.sort_values("Self Seconds", ascending=False)
+
+    def file_reads_df(self) -> pd.DataFrame:
+        """ Reads per file: number of parses, bytes read and time spent parsing """
+        df = pd.DataFrame([vars(read) for read in self.file_reads], columns=["reader", "path", "bytes", "seconds"])
+        df = df.groupby(["path", "reader"]).agg(Reads=("seconds", "size"), Bytes=("bytes", "sum"), Seconds=("seconds", "sum"))
+        return df.sort_values("Reads", ascending=False)
+
+    @property
+    def n_file_reads(self) -> int:
+        return len(self.file_reads)
+
+    @property
+    def bytes_read(self) -> int:
+        return sum(read.bytes or 0 for read in self.file_reads)
+
+    def to_dict(self) -> dict:
+        return {
+            "wall_seconds": self.wall_seconds,
+            "functions": {name: {"calls": stats.calls, "cumulative_seconds": stats.cumulative_seconds,
+                                 "self_seconds": stats.self_seconds} for name, stats in self.functions.items()},
+            "file_reads": [vars(read) for read in self.file_reads],
+        }
+
+#################### Span Exporter ####################
+
+class JsonLinesSpanExporter:
+    """ Local exporter: appends every span as one json line to a file """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+
+    def export(self, spans: list):
+        with open(self.filepath, "a") as f:
+            for span in spans:
+                f.write(json.dumps(vars(span)) + "\n")
+
+#################### Recorder ####################
+
+def file_size(source) -> int:
+    if isinstance(source, (str, os.PathLike)) and os.path.isfile(source):
+        return os.path.getsize(source)
+    return None
+
+class Recorder:
+    """ Call stack of the active wrappers, one per instrument() context """
+
+    def __init__(self, report: InstrumentationReport, record_spans: bool):
+        self.report = report
+        self.record_spans = record_spans
+        self.stack = []  # [name, start, seconds of callees, span id]
+        self.trace_id = os.urandom(16).hex()
+
+    def call(self, name: str, function, args: tuple, kwargs: dict, attributes: dict = None):
+        stats = self.report.functions.setdefault(name, FunctionStats())
+        stats.calls += 1
+        stats.active += 1
+        parent_span_id = self.stack[-1][3] if self.stack else None
+        frame = [name, time.perf_counter(), 0.0, os.urandom(8).hex() if self.record_spans else None]
+        start_unix_nano = time.time_ns()
+        self.stack.append(frame)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.stack.pop()
+            stats.active -= 1
+            elapsed = time.perf_counter() - frame[1]
+            stats.self_seconds += elapsed - frame[2]
+            if stats.active == 0:
+                stats.cumulative_seconds += elapsed
+            if self.stack:
+                self.stack[-1][2] += elapsed
+            if self.record_spans:
+                self.report.spans.append(Span(name, self.trace_id, frame[3], parent_span_id,
+                                              start_unix_nano, time.time_ns(), attributes or {}))
+
+    def wrap(self, name: str, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            return self.call(name, function, args, kwargs)
+        return wrapper
+
+    def wrap_reader(self, name: str, reader):
+        @functools.wraps(reader)
+        def wrapper(source, *args, **kwargs):
+            start = time.perf_counter()
+            path = os.fspath(source) if isinstance(source, (str, os.PathLike)) else type(source).__name__
+            try:
+                return self.call(name, reader, (source,) + args, kwargs, {"file.path": path})
+            finally:
+                self.report.file_reads.append(FileRead(name, path, file_size(source), time.perf_counter() - start))
+        return wrapper
+
+def module_functions(module) -> dict:
+    """ Functions defined in the module itself, not the ones it imports """
+    return {name: obj for name, obj in vars(module).items()
+            if inspect.isfunction(obj) and obj.__module__ == module.__name__}
+
+@contextmanager
+def instrument(modules=DEFAULT_MODULES, exporter=None):
+    """
+    Args:
+        modules: names of the modules whose functions are measured
+        exporter: span exporter with an export(spans) method, e.g. JsonLinesSpanExporter,
+                  spans are only recorded when an exporter is given
+    Yields:
+        InstrumentationReport, complete when the context exits
+
+    with instrument() as report:
+        dcf.value_per_share(ModelInputs())
+    report.functions_df(), report.file_reads_df()
+    """
+    report = InstrumentationReport()
+    recorder = Recorder(report, record_spans=exporter is not None)
+    originals = []
+    for module_name in modules:
+        module = importlib.import_module(module_name)
+        for name, function in module_functions(module).items():
+            originals.append((module, name, function))
+            setattr(module, name, recorder.wrap(f"{module_name}.{name}", function))
+    for name in FILE_READERS:
+        reader = getattr(pd, name)
+        originals.append((pd, name, reader))
+        setattr(pd, name, recorder.wrap_reader(f"pandas.{name}", reader))
+
+    start = time.perf_counter()
+    try:
+        yield report
+    finally:
+        report.wall_seconds = time.perf_counter() - start
+        for module, name, function in reversed(originals):
+            setattr(module, name, function)
+        if exporter is not None and report.spans:
+            exporter.export(report.spans)
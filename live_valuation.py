@@ -0,0 +1,56 @@
+import dcf_module as dcf
+import forecast_engine as engine
+import options as opt
+from cost_of_capital.wacc_graph import WaccGraph
+from model_data.model_inputs import ModelInputs
+
+######################################## Live Valuation ########################################
+# The share price only enters the valuation through the market value of equity: the WACC weights,
+# the levered beta and so the cost of capital of stage 1, and the options value (the options are
+# valued on the share price). Everything else, the operating forecast, the adjustments and the
+# reference data, is evaluated once when the LiveValuation is created. A price update invalidates
+# the price-dependent nodes of the WaccGraph, revalues the options and rediscounts a copy of the
+# operating forecast: no file is read and no operating line item is recomputed.
+
+class LiveValuation:
+    """
+    Args:
+        data: ModelInputs instance, copied: updates never change the caller's inputs
+    """
+
+    def __init__(self, data: ModelInputs):
+        self.wacc_graph = WaccGraph(data)
+        self.data = self.wacc_graph.data    # the graph's copy, price updates go through the graph
+        self.columns = dcf.single_scenario_columns(self.data, self.wacc_graph)
+        self.riskfree_rate = self.wacc_graph.value("riskfree_rate")
+        self.operating_forecast = engine.free_cashflow_forecast(self.data, self.columns)
+        self.result = dcf.valuation_result(self.data, self.columns,
+                                           engine.equity_bridge(self.data, self.columns, self.operating_forecast))
+
+    @property
+    def price_per_share(self) -> float:
+        return self.data.price_per_share
+
+    def update_price(self, price_per_share: float) -> dcf.ValuationResult:
+        """
+        Args:
+            price_per_share: new share price
+        Returns:
+            ValuationResult at the new price, also kept as self.result
+        """
+        self.wacc_graph.update(price_per_share=price_per_share)
+        self.columns["cost_of_capital_stage_1"][0] = self.wacc_graph.cost_of_capital()
+        if self.data.are_options_outstanding:
+            self.columns["options_value"][0] = opt.total_options_value_after_tax(self.data, self.riskfree_rate)
+
+        forecast = engine.discount_forecast(self.data, self.operating_forecast.copy(), self.columns)
+        self.result = dcf.valuation_result(self.data, self.columns, engine.equity_bridge(self.data, self.columns, forecast))
+        return self.result
+
+    @property
+    def value_per_share(self) -> float:
+        return self.result.value_per_share
+
+    @property
+    def upside(self) -> float:
+        return self.result.upside
@@ -13,7 +13,8 @@ class ModelInputs(WaccInputs):
     stage_1_periods: int = 1
     stage_2_periods: int = 4
     stage_3_periods: int = 5
-    model_periods: int = 10
+    model_periods: int = None       # default: sum of the stage periods (5 to 50 years)
+    discounting_convention: str = "end of year"     # (end of year, mid-year or quarterly) timing of the cashflows within a year
 
     ### valuation drivers: growth, operating margin, sales to capital (reinvestment)
     
@@ -46,6 +47,9 @@ class ModelInputs(WaccInputs):
                                     # might do "Deferred Tax Assets" / marginal tax rate as approximation
                                     # otherwise user can input this manually, to be seen
                                     # "Net Deferred Tax Asset": https://breakingintowallstreet.com/kb/accounting/net-operating-losses/
+    nol_usage_limit_pct_of_income: float = 1.0     # share of a year's operating income NOLs can offset
+    nol_annual_usage_cap: float = None            # maximum NOL used per year, None: no cap
+    nol_expiry_years: int = None                  # years a loss can be carried forward, None: no expiry
     minority_interests: float = 49600 # not in stockrow data, but found on balance sheet
 
     # Income Statement
@@ -0,0 +1,52 @@
+import numpy as np
+
+######################################## Net Operating Loss ########################################
+# Carry-forward of net operating losses as a recursion over the periods, vectorized over scenarios.
+# Every year's loss is a new vintage; positive operating income is offset by the oldest vintages
+# first, up to the annual usage limit, and vintages older than the expiry are lost.
+# The opening balance is treated as a loss of the base year.
+
+def tax_schedule(operating_income: np.array, tax_rates: np.array, opening_net_operating_loss: np.array,
+                 usage_limit_pct_of_income: float = 1.0, annual_usage_cap: float = None,
+                 expiry_years: int = None) -> tuple:
+    """
+    Args:
+        operating_income: (N, P) operating income of the periods after the base year
+        tax_rates: (N, P) tax rates
+        opening_net_operating_loss: (N,) NOL balance at the end of the base year
+        usage_limit_pct_of_income: share of a year's positive operating income NOLs can offset (e.g. 0.8)
+        annual_usage_cap: maximum NOL used in one year (None: no cap)
+        expiry_years: years a loss can be carried forward (None: no expiry)
+    Returns:
+        (NOL balance available at the start of each period, taxable income, taxes), (N, P) arrays
+    """
+    n, n_periods = operating_income.shape
+    balance = np.empty((n, n_periods))
+    taxable_income = np.empty((n, n_periods))
+    cap = np.inf if annual_usage_cap is None else annual_usage_cap
+    losses = np.maximum(-operating_income, 0)
+    profits = np.maximum(operating_income, 0)
+
+    if expiry_years is None:
+        remaining = np.asarray(opening_net_operating_loss, dtype="float64").copy()
+        for t in range(n_periods):
+            balance[:, t] = remaining
+            used = np.minimum(remaining, np.minimum(profits[:, t] * usage_limit_pct_of_income, cap))
+            taxable_income[:, t] = profits[:, t] - used
+            remaining += losses[:, t] - used
+    else:
+        # vintages[:, v] is the unused loss of the base year (v = 0) or of period v
+        vintages = np.zeros((n, n_periods + 1))
+        vintages[:, 0] = opening_net_operating_loss
+        for t in range(n_periods):
+            # period t + 1 can use the losses of periods t + 1 - expiry_years .. t
+            vintages[:, :max(t + 1 - expiry_years, 0)] = 0
+            available = vintages[:, :t + 1]
+            balance[:, t] = available.sum(axis=1)
+            used = np.minimum(balance[:, t], np.minimum(profits[:, t] * usage_limit_pct_of_income, cap))
+            used_by_vintage = np.minimum(np.cumsum(available, axis=1), used[:, None])
+            available -= np.diff(used_by_vintage, axis=1, prepend=0)
+            taxable_income[:, t] = profits[:, t] - used
+            vintages[:, t + 1] = losses[:, t]
+
+    return balance, taxable_income, taxable_income * tax_rates
@@ -1,84 +1,98 @@
-import math
+import numpy as np
+from scipy.special import ndtr
 
-from scipy.stats import norm
-
-from dataloader import data_loader
 from model_data.model_inputs import ModelInputs
 from cost_of_capital import wacc
 
+######################################## Options ########################################
+# Dilution-adjusted Black-Scholes: the options are valued on the share price adjusted for the
+# options exercised, S = (price * shares + value of options) / (shares + options), and the value
+# of the options depends on S. Every grant tranche (strike, expiration, count) is valued at once
+# and the shared adjusted share price is solved with Newton's method.
 
-def adjusted_K(data: ModelInputs):
-    return data.strike_price_option
-
-def dividend_adjusted_interest_rate(data: ModelInputs):
-    return wacc.t_bond_rate(data) - data.annualised_dividend_yield_stock
-
-def adjusted_S(data: ModelInputs, val_per_option):
-    """  """
-    return(wacc.equity_market_value(data) + val_per_option * data.n_options) / (data.n_shares + data.n_options)
+def option_tranches(data: ModelInputs) -> tuple:
+    """ Strikes, expirations and counts of the option tranches as arrays (scalar inputs are one tranche) """
+    strikes, expirations, counts = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(data.strike_price_option, dtype="float64")),
+        np.atleast_1d(np.asarray(data.option_expiration_in_years, dtype="float64")),
+        np.atleast_1d(np.asarray(data.n_options, dtype="float64")))
+    return strikes, expirations, counts
 
-def calc_d_1(data: ModelInputs, val_per_option):
-    """  """
-    adj_K = adjusted_K(data)
-    adj_S = adjusted_S(data, val_per_option)
-    variance = data.std_stock**2
-    div_adj_int_rate = dividend_adjusted_interest_rate(data)
-    expiration = data.option_expiration_in_years
-    return (
-        (math.log(adj_S/adj_K) + (div_adj_int_rate + variance/2)*expiration) /
-        (variance**0.5 * expiration**0.5)
-    )
+def black_scholes(S: float, strikes, expirations, std, dividend_yield: float, rate: float) -> tuple:
+    """
+    Args:
+        S: (adjusted) share price
+        strikes, expirations: arrays of the tranches
+        std: annualized standard deviation of the stock
+        dividend_yield: annualized dividend yield
+        rate: riskfree rate
+    Returns:
+        (value per option, delta) arrays, with d_1 on the dividend adjusted interest rate
+    """
+    std_sqrt_t = std * np.sqrt(expirations)
+    d_1 = (np.log(S / strikes) + (rate - dividend_yield + std**2 / 2) * expirations) / std_sqrt_t
+    d_2 = d_1 - std_sqrt_t
+    discounted_dividend = np.exp(-dividend_yield * expirations)
+    N_d_1 = ndtr(d_1)
+    value = discounted_dividend * S * N_d_1 - strikes * np.exp(-rate * expirations) * ndtr(d_2)
+    return value, discounted_dividend * N_d_1
 
-def calc_N_d_1(data, val_per_option):
-    """  """
-    N_d_1 = calc_d_1(data, val_per_option)
-    return norm.cdf(N_d_1)
-
-
-def calc_d_2(data: ModelInputs, val_per_option):
-    """  """
-    d_1 = calc_d_1(data, val_per_option)
-    variance = data.std_stock**2
-    expiration = data.option_expiration_in_years
-    return d_1 - variance**0.5 * expiration**0.5
+def solve_values_per_option(price_per_share: float, n_shares: float, strikes, expirations, counts, std,
+                            dividend_yield: float, rate: float, tolerance: float = 1e-10,
+                            max_iterations: int = 50) -> np.array:
+    """
+    Newton iteration on the adjusted share price S, the root of
+    f(S) = S * (shares + options) - price * shares - sum(count * value per option(S)).
+    f'(S) = shares + sum(count * (1 - delta)) is at least the number of shares, so the iteration
+    converges in a few steps from S = price.
+    Returns:
+        Value per option of every tranche, NaN if an input is NaN
+    Raises:
+        ValueError if S has not converged within max_iterations
+    """
+    equity_market_value = price_per_share * n_shares
+    total_shares = n_shares + np.sum(counts)
+    S = price_per_share
+    for _ in range(max_iterations):
+        values, deltas = black_scholes(S, strikes, expirations, std, dividend_yield, rate)
+        f = S * total_shares - equity_market_value - np.sum(counts * values)
+        step = f / (total_shares - np.sum(counts * deltas))
+        S -= step
+        if abs(step) <= tolerance * max(abs(S), 1.0) or np.isnan(step):
+            break
+    else:
+        raise ValueError(f"Dilution-adjusted share price did not converge in {max_iterations} iterations, "
+                         f"last step {step}")
+    return black_scholes(S, strikes, expirations, std, dividend_yield, rate)[0]
 
-def calc_N_d_2(data: ModelInputs, val_per_option):
-    """  """
-    N_d_2 = calc_d_2(data, val_per_option)
-    return norm.cdf(N_d_2)
-    
-def value_per_option_formula(data: ModelInputs, adj_S, val_per_option):
-    """  """
-    dividend = data.annualised_dividend_yield_stock
-    expiration = data.option_expiration_in_years
-    adj_K = adjusted_K(data)
-    N_d_1 = calc_N_d_1(data, val_per_option)
-    N_d_2 = calc_N_d_2(data, val_per_option)
-    t_bond = data_loader.request_t_bond_rate(data)
-    return math.exp((0-dividend) * expiration) * adj_S * N_d_1 - adj_K * math.exp((0-t_bond) * expiration) * N_d_2
+def values_per_option(data: ModelInputs, riskfree_rate: float = None) -> np.array:
+    """ Value per option of every tranche (riskfree_rate: computed from data if None) """
+    if riskfree_rate is None:
+        riskfree_rate = wacc.riskfree_rate(data)
+    strikes, expirations, counts = option_tranches(data)
+    return solve_values_per_option(data.price_per_share, data.n_shares, strikes, expirations, counts,
+                                   data.std_stock, data.annualised_dividend_yield_stock, riskfree_rate)
 
-def value_per_option(data: ModelInputs):
-    """ Iterative process """
-    adj_S = data.price_per_share
-    val_per_option = 0
-    iter_count = 0
-    while iter_count < 2000:
-        adj_S = adjusted_S(data, val_per_option)
-        val_per_option = value_per_option_formula(data, adj_S, val_per_option)
-        iter_count += 1
-    return val_per_option
+def value_per_option(data: ModelInputs, riskfree_rate: float = None):
+    """ Value per option, averaged over the tranches weighted by count (riskfree_rate: computed from data if None) """
+    counts = option_tranches(data)[2]
+    if np.sum(counts) == 0:
+        return 0.0
+    return np.sum(values_per_option(data, riskfree_rate) * counts) / np.sum(counts)
 
-def total_options_value_pre_tax(data: ModelInputs):
-    return value_per_option(data) * data.n_options
+def total_options_value_pre_tax(data: ModelInputs, riskfree_rate: float = None):
+    counts = option_tranches(data)[2]
+    return float(np.sum(values_per_option(data, riskfree_rate) * counts))
 
-def total_options_value_pre_tax_adjusted_for_vesting(data: ModelInputs):
-    total_options_val_pt = total_options_value_pre_tax(data)
+def total_options_value_pre_tax_adjusted_for_vesting(data: ModelInputs, riskfree_rate: float = None):
+    total_options_val_pt = total_options_value_pre_tax(data, riskfree_rate)
     if data.adjust_option_value_for_vesting:
         return total_options_val_pt * data.option_vesting_probability
     return total_options_val_pt
 
-def total_options_value_after_tax(data: ModelInputs):
-    total_options_value_pre_tax = total_options_value_pre_tax_adjusted_for_vesting(data)
+def total_options_value_after_tax(data: ModelInputs, riskfree_rate: float = None):
+    """ riskfree_rate: computed from data if None """
+    total_options_value_pre_tax = total_options_value_pre_tax_adjusted_for_vesting(data, riskfree_rate)
     if data.adjust_option_value_for_taxes:
         return total_options_value_pre_tax * (1 - data.options_tax_rate)
     else:
@@ -0,0 +1,93 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import dcf_module as dcf
+from dataloader import data_loader
+from dataloader.data_loader_inputs import DataLoaderInputs
+from model_data.model_inputs import ModelInputs
+
+######################################## Portfolio Runner ########################################
+# Values a coverage universe in a process pool. The read-only reference tables (ERP by country,
+# industry betas, EV/Sales, interest coverage) are parsed once in the parent and installed in
+# every worker by the pool initializer. A failing company is reported in the results table
+# instead of stopping the run.
+
+RESULT_COLUMNS = ["Value per Share", "Price per Share", "Upside", "Cost of Capital", "Error"]
+
+#################### Manifest ####################
+
+def manifest_entries(manifest) -> list:
+    """
+    Args:
+        manifest: DataFrame with a 'ticker' column and ModelInputs fields as columns,
+                  list of dicts with a 'ticker' key,
+                  or dict of {ticker: dict of ModelInputs fields | ModelInputs instance}
+    Returns:
+        List of (ticker, ModelInputs fields or instance)
+    """
+    if isinstance(manifest, pd.DataFrame):
+        manifest = manifest.to_dict("records")
+    if isinstance(manifest, dict):
+        return list(manifest.items())
+
+    entries = []
+    for row in manifest:
+        fields = {name: value for name, value in row.items()
+                  if name != "ticker" and not (isinstance(value, float) and np.isnan(value))}
+        entries.append((row["ticker"], fields))
+    return entries
+
+def model_inputs_from_entry(entry) -> ModelInputs:
+    """ Company inputs, company tables are loaded from the company's own workbooks """
+    if isinstance(entry, ModelInputs):
+        return entry
+    return ModelInputs(**entry)
+
+#################### Workers ####################
+
+def value_company(ticker: str, entry) -> dict:
+    """ Runs in a worker process, every exception is kept as the company's error """
+    try:
+        data = model_inputs_from_entry(entry)
+        result = dcf.run_valuation(data)
+        return {
+            "Ticker": ticker,
+            "Value per Share": result.value_per_share,
+            "Price per Share": result.price_per_share,
+            "Upside": result.upside,
+            "Cost of Capital": result.forecast.years("Cost of Capital")[0, 0],
+            "Error": None,
+        }
+    except Exception as error:
+        return {"Ticker": ticker, "Error": f"{type(error).__name__}: {error}"}
+
+def value_universe(manifest, max_workers: int = None, reference_data: DataLoaderInputs = None,
+                   chunksize: int = 4) -> pd.DataFrame:
+    """
+    Args:
+        manifest: companies to value, see manifest_entries
+        max_workers: size of the process pool (default: number of cpus), 1 values in this process
+        reference_data: DataLoaderInputs with the reference filepaths shared by all companies
+        chunksize: companies sent to a worker per task
+    Returns:
+        Results table indexed by ticker, failed companies have an 'Error' and no values
+    """
+    entries = manifest_entries(manifest)
+    reference_tables = data_loader.load_reference_tables(reference_data or DataLoaderInputs())
+    max_workers = max_workers or os.cpu_count()
+
+    tickers = [ticker for ticker, _ in entries]
+    company_inputs = [entry for _, entry in entries]
+    if max_workers == 1:
+        data_loader.install_reference_tables(reference_tables)
+        rows = list(map(value_company, tickers, company_inputs))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=data_loader.install_reference_tables,
+                                 initargs=(reference_tables,)) as executor:
+            rows = list(executor.map(value_company, tickers, company_inputs, chunksize=chunksize))
+
+    df = pd.DataFrame(rows, columns=["Ticker"] + RESULT_COLUMNS).set_index("Ticker")
+    return df
@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+
+import batch_dcf
+import dcf_module as dcf
+import forecast_engine as engine
+import portfolio
+from model_data.model_inputs import ModelInputs
+
+######################################## Reverse DCF ########################################
+# Implied valuation driver: the value of one driver at which the value per share equals the market
+# price. A bracketed false position root finder (Illinois variant) runs in lock-step over a batch:
+# every iteration is one forecast engine evaluation of all unconverged scenarios or companies.
+# Companies are valued in one batch when they share the engine settings (stage lengths, methods,
+# see forecast_engine.ENGINE_SETTINGS), a universe is split into one batch per distinct setting.
+
+DEFAULT_BRACKETS = {
+    "growth_rate_stage_1": (-0.5, 1.0),
+    "operating_margin_target": (-0.5, 0.9),
+    "wacc_target_stage_2": (0.0, 0.5),
+}
+
+RESULT_COLUMNS = ["Target Price", "Value per Share", "Converged", "Iterations", "Error"]
+
+def check_driver(driver: str, bracket) -> tuple:
+    if driver not in batch_dcf.BATCH_COLUMNS:
+        raise ValueError(f"Unsupported driver: {driver}, use one of {batch_dcf.BATCH_COLUMNS}")
+    if bracket is None:
+        if driver not in DEFAULT_BRACKETS:
+            raise ValueError(f"No default bracket for {driver}, pass bracket=(low, high)")
+        bracket = DEFAULT_BRACKETS[driver]
+    return bracket
+
+#################### Root Finder ####################
+
+def solve_implied(data: ModelInputs, columns: dict, driver: str, target_prices, bracket,
+                  price_tolerance: float = 1e-8, xtol: float = 1e-12, max_iterations: int = 100) -> dict:
+    """
+    Args:
+        data: ModelInputs instance with the engine settings of the batch
+        columns: dict of (N,) arrays of the valuation drivers, see batch_dcf.scenario_columns
+        driver: batch column to solve for
+        target_prices: (N,) or scalar price per share to match
+        bracket: (low, high) driver values, scalars or (N,) arrays
+        price_tolerance: converged when the value per share is within this fraction of the target price
+        xtol: converged when the bracket is narrower than this
+        max_iterations: engine evaluations after the bracket evaluation
+    Returns:
+        {driver: (N,) implied values, NaN where the bracket holds no root or the solver did not converge,
+         "Value per Share": (N,) values at the implied driver, "Converged": (N,) bool,
+         "Iterations": (N,) engine evaluations of every row after the bracket evaluation}
+    """
+    n = len(columns[driver])
+    targets = np.broadcast_to(np.asarray(target_prices, dtype="float64"), (n,))
+    low = np.broadcast_to(np.asarray(bracket[0], dtype="float64"), (n,)).copy()
+    high = np.broadcast_to(np.asarray(bracket[1], dtype="float64"), (n,)).copy()
+
+    def residual(rows: np.array, x: np.array) -> np.array:
+        batch = {name: values[rows] for name, values in columns.items()}
+        batch[driver] = x
+        return engine.valuation(data, batch)["value_per_share"] - targets[rows]
+
+    # both bracket ends in one evaluation
+    rows = np.arange(n)
+    f_ends = residual(np.concatenate((rows, rows)), np.concatenate((low, high)))
+    f_low, f_high = f_ends[:n], f_ends[n:]
+    bracketed = np.isfinite(f_low) & np.isfinite(f_high) & (np.sign(f_low) != np.sign(f_high))
+
+    x = np.full(n, np.nan)
+    f = np.full(n, np.nan)
+    at_end = bracketed & ((f_low == 0) | (f_high == 0))
+    x[at_end] = np.where(f_low[at_end] == 0, low[at_end], high[at_end])
+    f[at_end] = 0
+    converged = at_end.copy()
+    last_side = np.zeros(n, dtype="int8")  # -1: low was replaced last, 1: high was replaced last
+
+    active = np.flatnonzero(bracketed & ~converged)
+    iterations = np.zeros(n, dtype="int64")
+    for _ in range(max_iterations):
+        if not active.size:
+            break
+        iterations[active] += 1
+        a, b, fa, fb = low[active], high[active], f_low[active], f_high[active]
+        x_new = (a * fb - b * fa) / (fb - fa)
+        f_new = residual(active, x_new)
+        x[active], f[active] = x_new, f_new
+
+        replaces_low = np.sign(f_new) == np.sign(fa)
+        # Illinois step: halve the residual of an end that is kept twice in a row
+        f_high[active] = np.where(replaces_low & (last_side[active] == -1), fb / 2, np.where(replaces_low, fb, f_new))
+        f_low[active] = np.where(~replaces_low & (last_side[active] == 1), fa / 2, np.where(replaces_low, f_new, fa))
+        low[active] = np.where(replaces_low, x_new, a)
+        high[active] = np.where(replaces_low, b, x_new)
+        last_side[active] = np.where(replaces_low, -1, 1)
+
+        done = (np.abs(f_new) <= price_tolerance * np.abs(targets[active])) | (np.abs(high[active] - low[active]) <= xtol)
+        converged[active] = done
+        active = active[~done]
+
+    x[~converged] = np.nan
+    return {
+        driver: x,
+        "Value per Share": np.where(converged, f + targets, np.nan),
+        "Converged": converged,
+        "Iterations": iterations,
+    }
+
+#################### Single Company ####################
+
+def implied_driver(data: ModelInputs, driver: str = "growth_rate_stage_1", target_price: float = None,
+                   bracket: tuple = None, **solver_options) -> float:
+    """
+    Args:
+        data: ModelInputs instance
+        driver: "growth_rate_stage_1", "operating_margin_target", "wacc_target_stage_2" or another batch column
+        target_price: price per share to match (default: data.price_per_share)
+        bracket: (low, high) driver values holding the root (default: DEFAULT_BRACKETS[driver])
+        solver_options: see solve_implied
+    Returns:
+        Driver value at which the value per share equals the target price, NaN if the bracket holds no root
+    """
+    bracket = check_driver(driver, bracket)
+    target_price = data.price_per_share if target_price is None else target_price
+    columns = dcf.single_scenario_columns(data)
+    return float(solve_implied(data, columns, driver, target_price, bracket, **solver_options)[driver][0])
+
+#################### Universe ####################
+
+def implied_drivers(manifest, driver: str = "growth_rate_stage_1", target_prices=None, bracket: tuple = None,
+                    **solver_options) -> pd.DataFrame:
+    """
+    Args:
+        manifest: companies, see portfolio.manifest_entries
+        driver: batch column to solve for
+        target_prices: {ticker: price} or Series (default: every company's price_per_share)
+        bracket: (low, high) driver values (default: DEFAULT_BRACKETS[driver])
+        solver_options: see solve_implied
+    Returns:
+        Table indexed by ticker with the implied driver, target price, value per share at the implied
+        driver and convergence; companies whose inputs fail have an 'Error' and no values
+    """
+    bracket = check_driver(driver, bracket)
+    target_prices = {} if target_prices is None else dict(target_prices)
+    entries = portfolio.manifest_entries(manifest)
+    rows = []
+    batches = {}  # engine settings -> (data, tickers, drivers of every company)
+    for ticker, entry in entries:
+        try:
+            data = portfolio.model_inputs_from_entry(entry)
+            engine.forecast_horizon(data)
+            drivers = dcf.valuation_drivers(data)
+            target_price = target_prices.get(ticker, data.price_per_share)
+        except Exception as error:
+            rows.append({"Ticker": ticker, "Error": f"{type(error).__name__}: {error}"})
+            continue
+        batch = batches.setdefault(engine.engine_settings(data), (data, [], [], []))
+        batch[1].append(ticker)
+        batch[2].append(drivers)
+        batch[3].append(target_price)
+
+    for data, tickers, drivers, prices in batches.values():
+        columns = {name: np.array([company[name] for company in drivers], dtype="float64")
+                   for name in batch_dcf.BATCH_COLUMNS}
+        result = solve_implied(data, columns, driver, np.array(prices, dtype="float64"), bracket, **solver_options)
+        for i, ticker in enumerate(tickers):
+            rows.append({"Ticker": ticker, driver: result[driver][i], "Target Price": prices[i],
+                         "Value per Share": result["Value per Share"][i], "Converged": result["Converged"][i],
+                         "Iterations": result["Iterations"][i], "Error": None})
+
+    df = pd.DataFrame(rows, columns=["Ticker", driver] + RESULT_COLUMNS).set_index("Ticker")
+    return df.loc[[ticker for ticker, _ in entries]]
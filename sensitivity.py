@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+import batch_dcf
+from model_data.model_inputs import ModelInputs
+
+######################################## Sensitivity Analysis ########################################
+# Every cell of a sensitivity grid or bar of a tornado chart is one scenario of the batch DCF,
+# so the whole table is valued in a single batched evaluation. Fields are batch columns
+# (see batch_dcf.BATCH_COLUMNS), all other inputs are taken from the base ModelInputs instance.
+
+def check_fields(fields):
+    unknown = [field for field in fields if field not in batch_dcf.BATCH_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unsupported sensitivity fields: {unknown}")
+
+#################### Sensitivity Grid ####################
+
+def sensitivity_grid(data: ModelInputs, axes: dict):
+    """
+    Args:
+        data: base ModelInputs instance
+        axes: {batch column: values}, e.g. {"growth_rate_stage_1": [0.1, 0.15], "cost_of_capital_stage_1": [0.08, 0.1]}
+    Returns:
+        Value per share for every combination of the values:
+        Series for one field, DataFrame (first field as index, second as columns) for two fields,
+        Series with a MultiIndex for more fields
+    """
+    check_fields(axes)
+    names = list(axes)
+    values = [np.asarray(axis_values, dtype="float64") for axis_values in axes.values()]
+    mesh = np.meshgrid(*values, indexing="ij")
+    inputs = {name: grid.ravel() for name, grid in zip(names, mesh)}
+    value_per_share = batch_dcf.batch_value_per_share(data, inputs)
+
+    if len(names) == 2:
+        return pd.DataFrame(value_per_share.reshape(mesh[0].shape),
+                            index=pd.Index(values[0], name=names[0]),
+                            columns=pd.Index(values[1], name=names[1]))
+    index = pd.MultiIndex.from_product(values, names=names) if len(names) > 1 else pd.Index(values[0], name=names[0])
+    return pd.Series(value_per_share, index=index, name="Value per Share")
+
+#################### Tornado ####################
+
+def tornado(data: ModelInputs, fields, bump: float = 0.1, relative: bool = True) -> pd.DataFrame:
+    """
+    Args:
+        data: base ModelInputs instance
+        fields: batch columns to bump one at a time (at least one)
+        bump: size of the move down and up from the base value
+        relative: bump is a fraction of the base value (True) or an absolute change (False)
+    Returns:
+        DataFrame indexed by field with the low and high inputs, their values per share and the swing,
+        sorted by swing (largest first)
+    """
+    fields = list(fields)
+    check_fields(fields)
+    base = batch_dcf.base_scenario_columns(data)
+    missing = [field for field in fields if np.isnan(base[field])]
+    if missing:
+        raise ValueError(f"No base value to bump for: {missing}")
+
+    base_values = np.array([base[field] for field in fields])
+    moves = base_values * bump if relative else np.full(len(fields), bump)
+    low, high = base_values - moves, base_values + moves
+
+    # scenario 2i moves field i down, scenario 2i + 1 moves it up, the last scenario is the base
+    n = 2 * len(fields) + 1
+    inputs = {field: np.full(n, base[field]) for field in fields}
+    for i, field in enumerate(fields):
+        inputs[field][2 * i] = low[i]
+        inputs[field][2 * i + 1] = high[i]
+    columns = batch_dcf.scenario_columns(data, inputs, base=base)
+    all_values = batch_dcf.batch_valuation(data, columns)["value_per_share"]
+    value_per_share = all_values[:-1].reshape(len(fields), 2)
+
+    df = pd.DataFrame({
+        "Low Input": low,
+        "High Input": high,
+        "Low Value per Share": value_per_share[:, 0],
+        "High Value per Share": value_per_share[:, 1],
+    }, index=pd.Index(fields, name="Field"))
+    df["Swing"] = (df["High Value per Share"] - df["Low Value per Share"]).abs()
+    df.attrs["base_value_per_share"] = float(all_values[-1])
+    return df.sort_values("Swing", ascending=False)
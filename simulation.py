@@ -0,0 +1,205 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+
+import batch_dcf
+from model_data.model_inputs import ModelInputs
+
+######################################## Monte Carlo Valuation ########################################
+# Draws of the valuation drivers are valued chunk by chunk with the batch DCF. Each chunk only
+# updates running moments and a fixed-edge histogram, so memory stays bounded by chunk_size.
+# Every chunk gets its own child seed from one SeedSequence: results for a seed are identical
+# whether chunks run sequentially or in a process pool.
+
+#################### Distributions ####################
+
+def sample_distribution(rng: np.random.Generator, spec, size: int) -> np.array:
+    """
+    Args:
+        rng: numpy Generator of the chunk
+        spec: ("normal", 0.05, 0.01), ("uniform", 0.02, 0.08), ("triangular", 0.03, 0.035, 0.05), ...
+              i.e. a numpy Generator method name followed by its parameters,
+              or a callable taking (rng, size)
+        size: number of draws
+    Returns:
+        Array of draws
+    """
+    if callable(spec):
+        return np.asarray(spec(rng, size), dtype="float64")
+    name, *params = spec
+    if not hasattr(rng, name):
+        raise ValueError(f"Unknown distribution: {name}")
+    return getattr(rng, name)(*params, size=size)
+
+def sample_drivers(rng: np.random.Generator, distributions: dict, size: int) -> dict:
+    return {name: sample_distribution(rng, spec, size) for name, spec in distributions.items()}
+
+#################### Running Statistics ####################
+
+@dataclass
+class StreamingSummary:
+    """ Mergeable running moments and histogram of a stream of values """
+    bin_edges: np.array
+    count: int = 0
+    n_invalid: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    min: float = np.inf
+    max: float = -np.inf
+    underflow: int = 0
+    overflow: int = 0
+    counts: np.array = field(default=None)
+
+    def __post_init__(self):
+        if self.counts is None:
+            self.counts = np.zeros(len(self.bin_edges) - 1, dtype="int64")
+
+    def update(self, values: np.array):
+        finite = np.isfinite(values)
+        self.n_invalid += int((~finite).sum())
+        values = values[finite]
+        if len(values) == 0:
+            return
+        chunk = StreamingSummary(self.bin_edges, count=len(values), mean=values.mean(),
+                                 m2=((values - values.mean())**2).sum(), min=values.min(), max=values.max())
+        chunk.underflow = int((values < self.bin_edges[0]).sum())
+        chunk.overflow = int((values > self.bin_edges[-1]).sum())
+        chunk.counts, _ = np.histogram(values, bins=self.bin_edges)
+        self.merge(chunk)
+
+    def merge(self, other: "StreamingSummary"):
+        """ Chan et al. parallel update of mean and sum of squared deviations """
+        self.n_invalid += other.n_invalid
+        if other.count == 0:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta**2 * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        self.counts = self.counts + other.counts
+
+    @property
+    def std(self) -> float:
+        return (self.m2 / (self.count - 1))**0.5 if self.count > 1 else np.nan
+
+    def quantile(self, q):
+        """ Quantiles interpolated within histogram bins, tails beyond the edges within min/max """
+        edges = np.concatenate(([min(self.min, self.bin_edges[0])], self.bin_edges, [max(self.max, self.bin_edges[-1])]))
+        counts = np.concatenate(([self.underflow], self.counts, [self.overflow]))
+        cumulative = np.concatenate(([0], np.cumsum(counts))) / self.count
+        return np.interp(q, cumulative, edges)
+
+#################### Simulation ####################
+
+@dataclass
+class SimulationResult:
+    n_draws: int
+    n_invalid: int
+    price_per_share: float
+    mean: float
+    std: float
+    min: float
+    max: float
+    quantiles: dict
+    upside_quantiles: dict
+    probability_of_upside: float
+    histogram: np.array
+    bin_edges: np.array
+
+def histogram_edges(values: np.array, n_bins: int) -> np.array:
+    """ Fixed bin edges from the first chunk with finite values, widened so later chunks mostly fall inside """
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        raise ValueError("No finite values to fix the histogram edges")
+    low, high = np.quantile(values, [0.001, 0.999])
+    margin = (high - low) * 0.5 or abs(low) * 0.5 or 1.0
+    return np.linspace(low - margin, high + margin, n_bins + 1)
+
+def simulate_chunk(data: ModelInputs, base: dict, distributions: dict, size: int,
+                   seed: np.random.SeedSequence) -> np.array:
+    rng = np.random.default_rng(seed)
+    columns = batch_dcf.scenario_columns(data, sample_drivers(rng, distributions, size), base=base)
+    return batch_dcf.batch_valuation(data, columns)["value_per_share"]
+
+def summarize_chunk(data: ModelInputs, base: dict, distributions: dict, size: int,
+                    seed: np.random.SeedSequence, bin_edges: np.array) -> tuple:
+    values = simulate_chunk(data, base, distributions, size, seed)
+    summary = StreamingSummary(bin_edges)
+    summary.update(values)
+    return summary, count_upside(values, data.price_per_share)
+
+def count_upside(values: np.array, price_per_share: float) -> int:
+    """ Finite values above the price, the draws StreamingSummary counts """
+    return int((np.isfinite(values) & (values > price_per_share)).sum())
+
+def chunk_sizes(n_draws: int, chunk_size: int) -> list:
+    n_chunks = -(-n_draws // chunk_size)
+    return [min(chunk_size, n_draws - i * chunk_size) for i in range(n_chunks)]
+
+def simulate(data: ModelInputs, distributions: dict, n_draws: int, seed: int = None,
+             chunk_size: int = 100_000, n_bins: int = 2000, max_workers: int = None,
+             quantiles=(0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99)) -> SimulationResult:
+    """
+    Args:
+        data: base ModelInputs instance
+        distributions: {batch column: distribution spec}, see sample_distribution
+        n_draws: number of draws
+        seed: seed of the SeedSequence the chunk seeds are spawned from
+        chunk_size: draws valued at once, bounds memory
+        n_bins: histogram bins used for the quantile estimates
+        max_workers: value chunks in a process pool with this many workers (None: sequentially)
+    Returns:
+        SimulationResult with the distribution of value per share and upside versus price per share
+    """
+    sizes = chunk_sizes(n_draws, chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    base = batch_dcf.base_scenario_columns(data)
+
+    # chunks run in process until one has finite values, which fix the histogram edges for all other chunks
+    n_invalid = 0
+    for n_in_process, (size, chunk_seed) in enumerate(zip(sizes, seeds), start=1):
+        first_values = simulate_chunk(data, base, distributions, size, chunk_seed)
+        if np.isfinite(first_values).any():
+            break
+        n_invalid += size
+    else:
+        raise ValueError(f"None of the {n_draws} draws has a finite value per share, check the distributions")
+    summary = StreamingSummary(histogram_edges(first_values, n_bins), n_invalid=n_invalid)
+    summary.update(first_values)
+    n_upside = count_upside(first_values, data.price_per_share)
+
+    args = [(data, base, distributions, size, chunk_seed, summary.bin_edges)
+            for size, chunk_seed in zip(sizes[n_in_process:], seeds[n_in_process:])]
+    if max_workers:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            chunk_results = executor.map(summarize_chunk, *zip(*args)) if args else []
+            for chunk_summary, chunk_upside in chunk_results:
+                summary.merge(chunk_summary)
+                n_upside += chunk_upside
+    else:
+        for chunk_args in args:
+            chunk_summary, chunk_upside = summarize_chunk(*chunk_args)
+            summary.merge(chunk_summary)
+            n_upside += chunk_upside
+
+    value_quantiles = {q: float(value) for q, value in zip(quantiles, summary.quantile(quantiles))}
+    return SimulationResult(
+        n_draws=n_draws,
+        n_invalid=summary.n_invalid,
+        price_per_share=data.price_per_share,
+        mean=summary.mean,
+        std=summary.std,
+        min=summary.min,
+        max=summary.max,
+        quantiles=value_quantiles,
+        upside_quantiles={q: value / data.price_per_share - 1 for q, value in value_quantiles.items()},
+        probability_of_upside=n_upside / summary.count if summary.count else np.nan,
+        histogram=summary.counts,
+        bin_edges=summary.bin_edges,
+    )